@@ -0,0 +1,82 @@
+# Comparación de los backends de server.py (eventlet y asyncio)
+#
+# Levanta server.py con cada backend en un puerto propio, le aplica la
+# misma carga sintética de loadgen.py y muestra los resultados lado a lado:
+# caudal, pérdidas, latencia de reparto y CPU del servidor.
+#
+#   python bench_backends.py --rooms 20 --users 5 --speakers 2 --duration 20
+import os
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+
+import loadgen
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BACKENDS = ("eventlet", "asyncio")
+
+
+def wait_for_port(host, port, timeout=15.0):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		try:
+			with socket.create_connection((host, port), timeout=0.5):
+				return True
+		except OSError:
+			time.sleep(0.2)
+	return False
+
+
+def run_backend(backend, port, args):
+	"""Correr la carga contra server.py con `backend`; None si no arrancó"""
+	command = [sys.executable, os.path.join(ROOT, "server.py"), "--backend", backend, "--port", str(port)]
+	if args.mix:
+		command.append("--mix")
+	server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+	try:
+		if not wait_for_port("localhost", port):
+			print(f"server.py --backend {backend} no arrancó")
+			return None
+		print(f"\n=== {backend} ===")
+		args.url = f"http://localhost:{port}"
+		args.server_pid = server.pid
+		return asyncio.run(loadgen.main(args))
+	finally:
+		server.terminate()
+		server.wait()
+
+
+def main(args):
+	results = {}
+	for index, backend in enumerate(args.backends):
+		stats = run_backend(backend, args.port + index, args)
+		if stats is not None:
+			results[backend] = stats
+		# Dejar que el sistema libere los sockets antes del próximo
+		time.sleep(1.0)
+
+	if not results:
+		return
+	names = list(results)
+	rows = [
+		("Recibidos/s", lambda s: f"{s.received_frames / s.elapsed:.0f}"),
+		("MB/s recibidos", lambda s: f"{s.received_bytes / s.elapsed / 1e6:.2f}"),
+		("Perdidos %", lambda s: "n/d" if s.dropped is None else f"{100 * s.dropped / max(s.expected, 1):.2f}"),
+		("Latencia p50 ms", lambda s: f"{loadgen.percentile_ms(s.latencies, 50):.1f}"),
+		("Latencia p99 ms", lambda s: f"{loadgen.percentile_ms(s.latencies, 99):.1f}"),
+		("CPU servidor %", lambda s: "n/d" if s.server_cpu is None else f"{s.server_cpu:.1f}"),
+	]
+	print()
+	print(f"{'':<18}" + "".join(f"{name:>12}" for name in names))
+	for label, value in rows:
+		print(f"{label:<18}" + "".join(f"{value(results[name]):>12}" for name in names))
+
+
+if __name__ == "__main__":
+	parser = loadgen.build_parser("Comparación de los backends eventlet y asyncio de server.py")
+	parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+	parser.add_argument("--port", type=int, default=3600, help="Puerto del primer servidor (los siguientes, +1)")
+	parser.add_argument("--mix", action="store_true", help="Correr los servidores en modo mezcla")
+	main(parser.parse_args())
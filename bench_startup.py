@@ -0,0 +1,91 @@
+# Medición del arranque del cliente
+#
+# Cada medición corre en un proceso nuevo (arranque en frío del intérprete)
+# y se informa la mediana de varias repeticiones:
+#   - importar window.home (lo que carga main.py antes de abrir la ventana)
+#   - construir la ventana con QUiLoader y con la clase generada por pyside6-uic
+#   - listar los dispositivos de audio
+#
+#   pyside6-uic src/ui/main.ui -o src/ui/ui_main.py
+#   python bench_startup.py --runs 10
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(ROOT, "src")
+
+# Cada fragmento imprime los segundos que tardó en la última línea
+SNIPPETS = {
+	"import window.home": """
+import time
+start = time.perf_counter()
+import window.home
+print(time.perf_counter() - start)
+""",
+	"ventana (QUiLoader)": """
+import time
+from PySide6.QtWidgets import QApplication
+app = QApplication([])
+from window.window import CreateWindow
+start = time.perf_counter()
+CreateWindow("./src/ui/main.ui")
+print(time.perf_counter() - start)
+""",
+	"ventana (clase generada)": """
+import time
+from PySide6.QtWidgets import QApplication
+app = QApplication([])
+from window.window import CreateWindow
+start = time.perf_counter()
+from ui.ui_main import Ui_Dialog
+CreateWindow("./src/ui/main.ui", ui_class=Ui_Dialog)
+print(time.perf_counter() - start)
+""",
+	"listar dispositivos": """
+import time
+start = time.perf_counter()
+from window.device_probe import list_devices
+list_devices()
+print(time.perf_counter() - start)
+""",
+}
+
+
+def run_once(code):
+	"""Segundos medidos por `code` en un intérprete nuevo, o None si falló"""
+	env = dict(os.environ)
+	env["PYTHONPATH"] = SRC + os.pathsep + env.get("PYTHONPATH", "")
+	env.setdefault("QT_QPA_PLATFORM", "offscreen")
+	result = subprocess.run(
+		[sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True,
+	)
+	if result.returncode != 0:
+		return None
+	try:
+		return float(result.stdout.strip().splitlines()[-1])
+	except (IndexError, ValueError):
+		return None
+
+
+def main(args):
+	for name, code in SNIPPETS.items():
+		times = []
+		for _ in range(args.runs):
+			seconds = run_once(code)
+			if seconds is None:
+				break
+			times.append(seconds)
+		if not times:
+			print(f"{name:<26} n/d (falló; ¿falta una dependencia o src/ui/ui_main.py?)")
+			continue
+		print(f"{name:<26} mediana {statistics.median(times) * 1000:7.1f} ms, "
+			  f"mín {min(times) * 1000:7.1f} ms ({len(times)} corridas)")
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Tiempo de arranque del cliente")
+	parser.add_argument("--runs", type=int, default=5, help="Repeticiones por medición")
+	main(parser.parse_args())
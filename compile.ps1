@@ -1 +1,2 @@
+pyside6-uic src/ui/main.ui -o src/ui/ui_main.py
 pyinstaller --noconfirm --onedir --windowed --add-data "src/ui;src/ui" ./src/main.py
\ No newline at end of file
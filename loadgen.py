@@ -0,0 +1,215 @@
+# Generador de carga sin interfaz para server.py
+#
+# Lanza cientos de clientes sintéticos (sin sounddevice ni Qt) que hablan el
+# mismo protocolo que run_client_process: entran con 'new_user', transmiten
+# bloques de audio sintéticos por 'voice' y opcionalmente mandan chat.
+# Al final informa el caudal del relay, percentiles de latencia de reparto,
+# paquetes perdidos y el uso de CPU del servidor.
+#
+#   python loadgen.py --rooms 20 --users 5 --speakers 2 --duration 30 --server-pid 1234
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+from collections import deque
+import numpy as np
+import socketio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from audio.frame import encode_frame
+from audio.rates import DEFAULT_WIRE_SAMPLERATE
+
+
+def read_cpu_seconds(pid):
+	"""Tiempo de CPU (usuario + sistema) consumido por `pid`"""
+	try:
+		import psutil
+		times = psutil.Process(pid).cpu_times()
+		return times.user + times.system
+	except ImportError:
+		pass
+	try:
+		with open(f"/proc/{pid}/stat") as f:
+			fields = f.read().rsplit(")", 1)[1].split()
+		return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+	except (OSError, IndexError, ValueError):
+		return None
+
+
+class Stats:
+	"""Contadores compartidos por todos los clientes sintéticos"""
+
+	def __init__(self):
+		self.sent_frames = 0
+		self.sent_bytes = 0
+		self.expected = 0  # Paquetes que deberían llegar (enviados x oyentes)
+		self.received_frames = 0
+		self.received_bytes = 0
+		self.unmatched = 0  # Recibidos sin marca de envío (p. ej. mezcla)
+		self.chat_received = 0
+		self.latencies = []
+		# Marca de tiempo de envío de cada paquete, por contenido
+		self._sent_at = {}
+		self._order = deque()
+
+	def on_sent(self, payload, listeners):
+		self.sent_frames += 1
+		self.sent_bytes += len(payload)
+		self.expected += listeners
+		self._sent_at[payload] = time.perf_counter()
+		self._order.append(payload)
+		if len(self._order) > 200000:
+			self._sent_at.pop(self._order.popleft(), None)
+
+	def on_received(self, payload):
+		self.received_frames += 1
+		self.received_bytes += len(payload)
+		sent_at = self._sent_at.get(payload)
+		if sent_at is None:
+			self.unmatched += 1
+		else:
+			self.latencies.append(time.perf_counter() - sent_at)
+
+
+class SyntheticClient:
+	"""Cliente sin audio real que reproduce el protocolo de run_client_process"""
+
+	def __init__(self, url, room_code, name, stats, speaker, args):
+		self.url = url
+		self.room_code = room_code
+		self.name = name
+		self.stats = stats
+		self.speaker = speaker
+		self.args = args
+		self.listeners = args.users - 1
+		self.sio = socketio.AsyncClient(reconnection=False, handle_sigint=False)
+		self.sio.on("voice", self.on_voice)
+		self.sio.on("chat_message", self.on_chat)
+		self.rng = np.random.default_rng()
+
+	async def on_voice(self, sender, data, relay_time=0.0):
+		self.stats.on_received(bytes(data))
+
+	async def on_chat(self, msg, msg_id=None):
+		self.stats.chat_received += 1
+
+	async def connect(self):
+		await self.sio.connect(self.url, transports=["websocket"])
+		await self.sio.emit("new_user", {
+			"name": self.name,
+			"room_code": self.room_code,
+			"codecs": [self.args.codec],
+			"user_id": uuid.uuid4().hex,
+		})
+
+	def make_frame(self, index):
+		frames = int(self.args.samplerate * self.args.frame_ms / 1000)
+		t = (np.arange(frames) + index * frames) / self.args.samplerate
+		# Tono más ruido: cada paquete es distinto, así se puede identificar
+		block = 0.2 * np.sin(2 * np.pi * 220 * t) + 0.01 * self.rng.standard_normal(frames)
+		return encode_frame(block.astype(np.float32)[:, np.newaxis], self.args.samplerate, self.args.codec)
+
+	async def run(self, deadline):
+		period = self.args.frame_ms / 1000
+		next_send = time.perf_counter()
+		index = 0
+		while time.perf_counter() < deadline:
+			if self.speaker:
+				payload = self.make_frame(index)
+				self.stats.on_sent(payload, self.listeners)
+				await self.sio.emit("voice", payload)
+				if self.args.chat_every and index % self.args.chat_every == 0:
+					await self.sio.emit("chat_message", f"{self.name}: mensaje {index}")
+			index += 1
+			next_send += period
+			await asyncio.sleep(max(0, next_send - time.perf_counter()))
+
+	async def close(self):
+		if self.sio.connected:
+			await self.sio.disconnect()
+
+
+def percentile_ms(values, q):
+	return float(np.percentile(values, q) * 1000) if len(values) else float("nan")
+
+
+async def main(args):
+	stats = Stats()
+	clients = []
+	for room in range(args.rooms):
+		for user in range(args.users):
+			clients.append(SyntheticClient(
+				args.url, f"load-{room}", f"user-{room}-{user}", stats,
+				speaker=user < args.speakers, args=args,
+			))
+
+	# Conectar poco a poco para no medir la tormenta de conexiones
+	limit = asyncio.Semaphore(args.connect_concurrency)
+
+	async def connect(client):
+		async with limit:
+			await client.connect()
+
+	print(f"Conectando {len(clients)} clientes en {args.rooms} salas...")
+	await asyncio.gather(*(connect(c) for c in clients))
+	await asyncio.sleep(1.0)
+
+	cpu_start = read_cpu_seconds(args.server_pid) if args.server_pid else None
+	start = time.perf_counter()
+	deadline = start + args.duration
+	await asyncio.gather(*(c.run(deadline) for c in clients))
+	# Dejar que lleguen los últimos paquetes
+	await asyncio.sleep(args.drain)
+	elapsed = time.perf_counter() - start
+	cpu_end = read_cpu_seconds(args.server_pid) if args.server_pid else None
+
+	await asyncio.gather(*(c.close() for c in clients))
+
+	dropped = max(0, stats.expected - stats.received_frames) if not stats.unmatched else None
+	stats.elapsed = elapsed
+	stats.dropped = dropped
+	stats.server_cpu = None
+	if cpu_start is not None and cpu_end is not None:
+		stats.server_cpu = 100 * (cpu_end - cpu_start) / elapsed
+	print()
+	print(f"Clientes:           {len(clients)} ({args.rooms} salas x {args.users}, {args.speakers} hablantes/sala)")
+	print(f"Enviados:           {stats.sent_frames} paquetes, {stats.sent_bytes / elapsed / 1e6:.2f} MB/s")
+	print(f"Recibidos:          {stats.received_frames} paquetes ({stats.received_frames / elapsed:.0f}/s), "
+		  f"{stats.received_bytes / elapsed / 1e6:.2f} MB/s")
+	if dropped is None:
+		print(f"Perdidos:           n/d (modo mezcla: {stats.unmatched} paquetes mezclados)")
+	else:
+		print(f"Perdidos:           {dropped} ({100 * dropped / max(stats.expected, 1):.2f} %)")
+	if stats.latencies:
+		print(f"Latencia reparto:   p50 {percentile_ms(stats.latencies, 50):.1f} ms, "
+			  f"p95 {percentile_ms(stats.latencies, 95):.1f} ms, p99 {percentile_ms(stats.latencies, 99):.1f} ms, "
+			  f"máx {max(stats.latencies) * 1000:.1f} ms")
+	if args.chat_every:
+		print(f"Chat recibido:      {stats.chat_received}")
+	if stats.server_cpu is not None:
+		print(f"CPU del servidor:   {stats.server_cpu:.1f} % de un núcleo")
+	return stats
+
+
+def build_parser(description="Generador de carga para server.py"):
+	parser = argparse.ArgumentParser(description=description)
+	parser.add_argument("--url", default="http://localhost:3500")
+	parser.add_argument("--rooms", type=int, default=10)
+	parser.add_argument("--users", type=int, default=5, help="Usuarios por sala")
+	parser.add_argument("--speakers", type=int, default=1, help="Hablantes por sala")
+	parser.add_argument("--duration", type=float, default=20.0, help="Segundos de transmisión")
+	parser.add_argument("--drain", type=float, default=2.0, help="Segundos de espera al final")
+	parser.add_argument("--frame-ms", type=int, default=40)
+	parser.add_argument("--samplerate", type=int, default=DEFAULT_WIRE_SAMPLERATE)
+	parser.add_argument("--codec", default="pcm16")
+	parser.add_argument("--chat-every", type=int, default=0, help="Un mensaje de chat cada N bloques (0 = nunca)")
+	parser.add_argument("--connect-concurrency", type=int, default=50)
+	parser.add_argument("--server-pid", type=int, default=None, help="PID de server.py para medir su CPU")
+	return parser
+
+
+if __name__ == "__main__":
+	asyncio.run(main(build_parser().parse_args()))
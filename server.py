@@ -1,69 +1,480 @@
-
 # Nuevo servidor Socket.IO compatible con el cliente
+import os
+import re
+import sys
+import time
+import uuid
+import zlib
+import socket
+import signal
+import argparse
+import threading
+import subprocess
 import socketio
-import eventlet
 import numpy as np
 
-sio = socketio.Server(logger=False, engineio_logger=False)
-app = socketio.WSGIApp(sio)
+# Los módulos compartidos con el cliente (códecs, formato de paquete) viven en src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from relay.mixer import RoomMixer
+from relay.store import RoomStore
+from relay.chat_log import ChatLog
+from relay.broker import Broker, BrokerManager, BrokerRoomStore
+from relay.metrics import ServerMetrics
+from relay.outbound import VoiceQueueManager
+from relay.udp_relay import UdpRelay
 
-users = {}
+# La voz a cada oyente pasa por una cola acotada (ver src/relay/outbound.py).
+# Con --backend asyncio se reemplaza por un AsyncServerFacade y los mismos
+# handlers pasan a un socketio.AsyncServer (ver use_asyncio)
+sio = socketio.Server(client_manager=VoiceQueueManager(), logger=False, engineio_logger=False)
+BACKEND = "eventlet"
+# Métricas en /metrics (formato Prometheus) desde la misma app WSGI
+metrics = ServerMetrics()
+app = socketio.WSGIApp(sio, metrics.wsgi_app)
+
+# Estado de las salas; con varios workers se reemplaza por el del broker
+store = RoomStore()
+# Sala e id estable de cada sid conectado a este proceso (caché local para
+# el camino de voz)
 user_to_room = {}
+user_ids = {}
+
+# Ids que acepta el servidor de los clientes: el id viaja en la etiqueta de
+# cada paquete de voz del lado del cliente, que tiene lugar para 48 bytes
+# (ver utils/shm_ring.py). Los demás se reemplazan por uno generado.
+USER_ID_PATTERN = re.compile(r"[0-9A-Za-z_-]{1,32}")
+
+# Códec que entienden todos los clientes (ver src/audio/codec.py)
+DEFAULT_CODEC = "pcm16"
+
+# Modo mezcla (MCU): el servidor envía a cada oyente una sola mezcla
+MIX_MODE = False
+# Etiqueta de emisor de los paquetes mezclados
+MIX_SENDER = "mix"
+room_mixers = {}
+
+# Relay UDP de voz (ver relay/udp_relay.py); None si no se pidió --udp-port
+media = None
+
+# Varios workers: cada sala se mezcla en el worker que le toca por hash
+WORKERS = 1
+WORKER_INDEX = 0
+
+def owns_room(code):
+	"""¿Le toca a este worker el reloj de mezcla de la sala?"""
+	return zlib.crc32(code.encode()) % WORKERS == WORKER_INDEX
+
+# Miembros por sala para contar los paquetes enviados; se refresca como mucho
+# una vez por segundo para no consultar el store en cada paquete
+room_sizes = {}
+
+def room_size(code):
+	now = time.monotonic()
+	cached = room_sizes.get(code)
+	if cached is None or now - cached[1] > 1.0:
+		cached = room_sizes[code] = (len(store.members(code)), now)
+	return cached[0]
+
+metrics.active_rooms = lambda: len(store.rooms())
+metrics.active_sids = lambda: len(user_to_room)
+# sio.manager cambia al usar el broker: se resuelve en cada lectura
+metrics.slow_clients = lambda: sio.manager.slow_clients
+metrics.slow_episodes = lambda: sio.manager.slow_episodes
+metrics.voice_dropped = lambda: sio.manager.voice_dropped
+metrics.udp_peers = lambda: media.peers if media else 0
+metrics.udp_datagrams_in = lambda: media.datagrams_in if media else 0
+metrics.udp_datagrams_out = lambda: media.datagrams_out if media else 0
+metrics.udp_lost = lambda: media.lost if media else 0
+
+# Cada cuánto se mide el retraso del event loop
+LOOP_LAG_INTERVAL = 0.5
+
+def drive_loop(loop):
+	"""Correr con eventlet un bucle generador que cede cuántos segundos dormir
+
+	Los bucles de fondo se escriben así para que sirvan también con el
+	backend asyncio (ver relay/async_backend.py).
+	"""
+	for delay in loop:
+		sio.sleep(delay)
+
+def drive_blocking(loop):
+	"""Lo mismo que drive_loop en un hilo común, sin event loop"""
+	for delay in loop:
+		time.sleep(delay)
+
+def start_loop(loop, *args):
+	if BACKEND == "asyncio":
+		sio.start_background_task(loop, *args)
+	else:
+		sio.start_background_task(drive_loop, loop(*args))
+
+def loop_lag_monitor():
+	"""Medir cuánto se pasa cada sleep del periodo pedido"""
+	while True:
+		start = time.monotonic()
+		yield LOOP_LAG_INTERVAL
+		metrics.observe_loop_lag(max(0.0, time.monotonic() - start - LOOP_LAG_INTERVAL))
+
+def measured_emit(event, data, **kwargs):
+	"""sio.emit midiendo su duración para metrics.observe_emit
+
+	Con asyncio el emit corre en una tarea: la duración la mide la tarea al
+	terminar, no la llamada (ver AsyncServerFacade.emit).
+	"""
+	if BACKEND == "asyncio":
+		sio.emit(event, data, on_done=lambda seconds: metrics.observe_emit(event, seconds), **kwargs)
+		return
+	start = time.perf_counter()
+	sio.emit(event, data, **kwargs)
+	metrics.observe_emit(event, time.perf_counter() - start)
+
+def chat_flush_loop(flush, interval):
+	"""Escribir el registro de chat pendiente aunque nadie escriba"""
+	while True:
+		yield interval
+		flush()
+
+def start_chat_flush(store):
+	if store.chat_log is not None:
+		start_loop(chat_flush_loop, store.flush_chat, store.chat_log.flush_interval)
+
+def exit_on_sigterm():
+	"""Terminar con SIGTERM como con Ctrl+C, pasando por los finally que
+	vacían el registro de chat"""
+	def handler(signum, frame):
+		raise KeyboardInterrupt
+	signal.signal(signal.SIGTERM, handler)
 
 @sio.event
 def connect(sid, environ):
 	print(f"Client connected: {sid}")
-	
+	metrics.on_connect()
+
 
 @sio.event
 def disconnect(sid):
-	code = user_to_room[sid]
-	sio.emit('disconnect_user', room=code)
+	metrics.on_disconnect(user_ids.get(sid))
+	leave_current_room(sid)
+	if media is not None:
+		media.forget(sid)
+
+def leave_current_room(sid):
+	code = user_to_room.pop(sid, None)
+	user_ids.pop(sid, None)
+	if code is None:
+		return
 	sio.leave_room(sid, code)
 
-	del user_to_room[sid]
+	left = store.leave(sid)
+	members = store.members(code)
+	# Delta para los que quedan: solo el id de quien se fue, salvo que el
+	# mismo usuario siga en la sala con otro sid (se reconectó)
+	if left is not None and left[1] not in {user_id for user_id, _ in members.values()}:
+		sio.emit('user_left', {"id": left[1]}, room=code)
+	if code not in user_to_room.values():
+		# Último sid de la sala en este worker: sus series dejan de exportarse
+		# aquí aunque la sala siga en otros
+		if code not in room_mixers:
+			metrics.forget_room(code)
+		room_sizes.pop(code, None)
+	if code in room_mixers:
+		room_mixers[code].forget(sid)
 
 @sio.event
 def voice(sid, data):
 	# print(f"Received 'voice' event from {sid}. Data type: {type(data)}")
-	code = user_to_room[sid]
-	
-	sio.emit('voice', data, room=code, skip_sid=sid)
+	# Los paquetes son binarios (ver src/audio/frame.py) y se reenvían sin decodificar
+	if not isinstance(data, (bytes, bytearray)):
+		return
+	code = user_to_room.get(sid)
+	if code is None:
+		return
+	metrics.voice_in(code, len(data))
+
+	if MIX_MODE:
+		if owns_room(code):
+			push_to_mixer(code, sid, data)
+		else:
+			# El reloj de esta sala corre en otro worker
+			sio.manager.relay({
+				"type": "mix_push", "room": code, "sid": sid, "data": data,
+			})
+		return
+
+	# Se etiqueta con el id del emisor para que cada cliente tenga un buffer por
+	# hablante, y con la hora del relay para el trazado de latencia
+	measured_emit('voice', (user_ids[sid], data, time.time()), room=code, skip_sid=sid)
+	metrics.voice_out(code, len(data), room_size(code) - 1)
+
+def push_to_mixer(code, sid, data):
+	mixer = room_mixers.get(code)
+	if mixer is None:
+		mixer = room_mixers[code] = RoomMixer()
+		start_loop(mix_loop, code, mixer)
+	mixer.push(sid, data)
+
+def on_relay(message):
+	"""Mensajes propios del servidor que llegan de otros workers"""
+	if message.get("type") == "mix_push" and owns_room(message["room"]):
+		push_to_mixer(message["room"], message["sid"], message["data"])
+
+def mix_loop(code, mixer):
+	"""Reloj de la sala: mezcla y envía un bloque por periodo"""
+	next_tick = time.monotonic()
+	while True:
+		members = store.members(code)
+		if not members:
+			break
+		next_tick += mixer.period
+		for sid, packet in mixer.tick(list(members), store.room_codec(code, DEFAULT_CODEC)):
+			measured_emit('voice', (MIX_SENDER, packet, time.time()), to=sid)
+			metrics.voice_out(code, len(packet))
+
+		delay = next_tick - time.monotonic()
+		if delay < -mixer.period:
+			# Nos quedamos atrás (servidor saturado): no intentar recuperar
+			next_tick = time.monotonic()
+			delay = 0
+		yield max(0, delay)
+
+	room_mixers.pop(code, None)
+	if code not in user_to_room.values():
+		metrics.forget_room(code)
 
 @sio.event
 def chat_message(sid, msg):
-	code = user_to_room[sid]
+	code = user_to_room.get(sid)
+	if code is None:
+		return
 
-	sio.emit('chat_message', msg, room=code)
+	msg_id = store.add_chat(code, msg)
+	measured_emit('chat_message', (msg, msg_id), room=code)
 
 @sio.event
 def new_user(sid, user):
 	code = user["room_code"]
 	name = user["name"]
-	sio.enter_room(sid, code)
+	codecs = user.get("codecs") or [DEFAULT_CODEC]
+	# El cliente manda su propio id para conservarlo al reconectar
+	user_id = user.get("user_id")
+	if not isinstance(user_id, str) or not USER_ID_PATTERN.fullmatch(user_id):
+		user_id = uuid.uuid4().hex
+	leave_current_room(sid)
+	metrics.on_join(user_id)
 
-	if users.get(code, None) is None:
-		users[code] = {}
-	
-	users[code][sid] = name
+	store.join(code, sid, user_id, name, codecs)
 	user_to_room[sid] = code
+	user_ids[sid] = user_id
+	evict_previous_sids(code, sid, user_id)
+
+	# Quien entra recibe la lista completa y el chat reciente en un solo
+	# evento cada uno; los demás, solo el alta
+	sio.emit('roster', store.roster(code), to=sid)
+	backlog = store.chat_backlog(code)
+	if backlog:
+		sio.emit('chat_backlog', backlog, to=sid)
+	sio.emit('user_joined', {"id": user_id, "name": name}, room=code)
+	sio.enter_room(sid, code)
+	if media is not None:
+		# La voz puede ir por UDP; el cliente se presenta con este token
+		sio.emit('media', {"port": media.port, "token": media.register(sid)}, to=sid)
+
+	negotiate_codec(code, codecs)
+
+def evict_previous_sids(code, sid, user_id):
+	"""Sacar de la sala los sids anteriores del mismo usuario
+
+	Al reconectar, el sid viejo sigue en la sala hasta su ping timeout. Se
+	saca al entrar el nuevo; como el usuario sigue en la sala, nadie recibe
+	user_left.
+	"""
+	for other, (other_id, _) in store.members(code).items():
+		if other == sid or other_id != user_id:
+			continue
+		if other in user_to_room:
+			leave_current_room(other)
+		else:
+			# Conectado a otro worker
+			store.leave(other)
+			sio.leave_room(other, code)
+
+def negotiate_codec(code, preference):
+	"""Elegir el primer códec del que entra que entiendan todos los de la sala"""
+	codec = store.negotiate_codec(code, preference, DEFAULT_CODEC)
+	sio.emit('codec', codec, room=code)
+
+def make_store(args):
+	"""RoomStore con el tamaño de historial y el registro pedidos"""
+	chat_log = ChatLog(args.chat_log) if args.chat_log else None
+	return RoomStore(chat_history=args.chat_history, chat_log=chat_log)
+
+def use_broker(address):
+	"""Compartir salas y emits con los demás workers a través del broker"""
+	global store
+	store = BrokerRoomStore(address)
+	sio.manager = BrokerManager(address, on_relay=on_relay)
+	sio.manager.set_server(sio)
+
+def start_media(host, port):
+	"""Levantar el relay UDP de voz en el mismo event loop que Socket.IO"""
+	global media
+	from eventlet.green import socket as green_socket
+
+	sock = green_socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.bind((host, port))
+	# La voz que llega por UDP entra por el mismo handler que la de Socket.IO
+	media = UdpRelay(sock, port, on_voice=voice)
+	sio.manager.media = media
+	sio.start_background_task(media.serve)
 
-	for name in users[code].values():
-		sio.emit('new_user', name, room=code)
+def use_asyncio():
+	"""Pasar los handlers a un socketio.AsyncServer servido por ASGI"""
+	global sio, app, BACKEND
+	from relay.async_backend import AsyncServerFacade
+	from relay.outbound import AsyncVoiceQueueManager
+
+	server = socketio.AsyncServer(
+		async_mode="asgi", client_manager=AsyncVoiceQueueManager(),
+		logger=False, engineio_logger=False,
+	)
+	for event, handler in sio.handlers["/"].items():
+		server.on(event, handler)
+	sio = AsyncServerFacade(server)
+	app = socketio.ASGIApp(server, other_asgi_app=metrics.asgi_app, on_startup=on_asyncio_startup)
+	BACKEND = "asyncio"
+
+async def on_asyncio_startup():
+	"""Tareas de fondo del backend asyncio, ya con el event loop corriendo"""
+	global media
+	start_loop(loop_lag_monitor)
+	start_chat_flush(store)
+	if args.udp_port:
+		from relay.async_backend import open_media_endpoint
+
+		media = UdpRelay(None, args.udp_port, on_voice=voice)
+		sio.manager.media = media
+		await open_media_endpoint(media, args.host, args.udp_port)
+
+def default_broker_address():
+	if hasattr(socket, "AF_UNIX"):
+		return "unix:/tmp/voicechat-broker.sock"
+	return "127.0.0.1:3599"
+
+def run_workers(args):
+	"""Proceso maestro: levanta el broker y N workers en el mismo puerto"""
+	address = args.broker or default_broker_address()
+	if address.startswith("unix:") and os.path.exists(address[len("unix:"):]):
+		os.unlink(address[len("unix:"):])
+	broker = Broker(address, make_store(args))
+	broker.start()
+	print(f"Broker escuchando en {address}")
+	if broker.store.chat_log is not None:
+		# El store vive en este proceso, que no tiene event loop: un hilo
+		loop = chat_flush_loop(lambda: broker.call("flush_chat", []), broker.store.chat_log.flush_interval)
+		threading.Thread(target=drive_blocking, args=(loop,), daemon=True).start()
+
+	workers = []
+	for index in range(args.workers):
+		command = [
+			sys.executable, os.path.abspath(__file__),
+			"--workers", str(args.workers), "--worker-index", str(index),
+			"--broker", address, "--host", args.host, "--port", str(args.port),
+		]
+		if args.mix:
+			command.append("--mix")
+		if args.udp_port:
+			command += ["--udp-port", str(args.udp_port)]
+		workers.append(subprocess.Popen(command))
+
+	try:
+		for worker in workers:
+			worker.wait()
+	except KeyboardInterrupt:
+		for worker in workers:
+			worker.terminate()
+	finally:
+		broker.shutdown()
 
 if __name__ == "__main__":
-    print("Socket.IO server listening on http://localhost:3500...")
-    
+    parser = argparse.ArgumentParser(description="Servidor de chat de voz")
+    parser.add_argument("--mix", action="store_true", help="Mezclar el audio en el servidor (una sola mezcla por oyente)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3500)
+    parser.add_argument("--workers", type=int, default=1, help="Procesos que comparten el puerto (requiere SO_REUSEPORT y transporte websocket)")
+    parser.add_argument("--worker-index", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--broker", default=None, help="Dirección del broker: unix:/ruta o host:puerto")
+    parser.add_argument("--chat-history", type=int, default=50, help="Mensajes de chat recientes por sala que recibe quien entra")
+    parser.add_argument("--chat-log", default=None, help="Archivo donde agregar todos los mensajes de chat (JSON por línea)")
+    parser.add_argument("--udp-port", type=int, default=None, help="Puerto UDP para la voz (con --workers, cada uno usa puerto + índice)")
+    parser.add_argument("--backend", choices=("eventlet", "asyncio"), default="eventlet",
+                        help="eventlet (WSGI) o asyncio (ASGI con uvicorn; sin --workers)")
+    args = parser.parse_args()
+    MIX_MODE = args.mix
+    exit_on_sigterm()
+
+    if args.backend == "asyncio":
+        if args.workers > 1:
+            parser.error("--backend asyncio todavía no admite --workers")
+        use_asyncio()
+        store = make_store(args)
+        print(f"Socket.IO server (asyncio) listening on http://{args.host}:{args.port}...")
+        if MIX_MODE:
+            print("Modo mezcla activado")
+        print(f"Métricas en http://{args.host}:{args.port}/metrics")
+        if args.udp_port:
+            print(f"Voz por UDP en {args.host}:{args.udp_port}")
+        try:
+            from relay.async_backend import run
+            run(app, args.host, args.port)
+        finally:
+            store.close()
+        sys.exit(0)
+
+    if args.workers > 1 and args.worker_index is None:
+        run_workers(args)
+        sys.exit(0)
+
+    import eventlet
+    import eventlet.wsgi
+
+    if args.worker_index is not None:
+        # Los sockets del broker tienen que ser cooperativos con eventlet
+        eventlet.monkey_patch()
+        WORKERS = args.workers
+        WORKER_INDEX = args.worker_index
+        metrics.worker = str(WORKER_INDEX)
+        use_broker(args.broker)
+    else:
+        store = make_store(args)
+        start_chat_flush(store)
+
+    print(f"Socket.IO server listening on http://{args.host}:{args.port}...")
+    if MIX_MODE:
+        print("Modo mezcla activado")
+    print(f"Métricas en http://{args.host}:{args.port}/metrics")
+    if args.udp_port:
+        udp_port = args.udp_port + WORKER_INDEX
+        start_media(args.host, udp_port)
+        print(f"Voz por UDP en {args.host}:{udp_port}")
+    start_loop(loop_lag_monitor)
+
     # Crear un logger silencioso
     class QuietLogger:
         def write(self, message):
             pass
-    
+
     # Configurar el servidor con logging silencioso
-    server = eventlet.listen(('localhost', 3500))
-    eventlet.wsgi.server(
-        server,
-        app,
-        log=QuietLogger(),  # Logger personalizado que no muestra nada
-        log_output=False     # Desactivar completamente los logs
-    )
\ No newline at end of file
+    server = eventlet.listen((args.host, args.port), reuse_port=WORKERS > 1)
+    try:
+        eventlet.wsgi.server(
+            server,
+            app,
+            log=QuietLogger(),  # Logger personalizado que no muestra nada
+            log_output=False     # Desactivar completamente los logs
+        )
+    finally:
+        if args.worker_index is None:
+            # Vaciar lo pendiente del registro de chat (con broker lo hace él)
+            store.close()
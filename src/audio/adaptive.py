@@ -0,0 +1,98 @@
+# Tamaño de trama y retardo de reproducción adaptativos.
+#
+# El micrófono captura siempre en bloques cortos (BASE_FRAME_MS) y los junta
+# en tramas del tamaño elegido, así que cambiar de tamaño no obliga a
+# reiniciar los streams. Con poco jitter se usan tramas cortas (menos
+# latencia); en enlaces malos, tramas largas (menos paquetes y cabeceras).
+
+FRAME_SIZES_MS = (10, 20, 40, 60)
+BASE_FRAME_MS = FRAME_SIZES_MS[0]
+
+
+class AdaptiveController:
+    """Elige el tamaño de trama y el retardo de reproducción con histéresis
+
+    Se alimenta periódicamente con el jitter medido, los vacíos (underruns)
+    de la salida y la profundidad de los buffers de reproducción. Sube de
+    tamaño tras UP_HOLD evaluaciones malas seguidas y baja solo tras
+    DOWN_HOLD buenas, de un escalón cada vez.
+    """
+
+    # La trama debe durar al menos JITTER_RATIO veces el jitter medido
+    JITTER_RATIO = 2.0
+    # Para bajar de tamaño el jitter tiene que quedar por debajo de la
+    # trama más pequeña con este margen extra
+    DOWN_MARGIN = 1.5
+    UP_HOLD = 2
+    DOWN_HOLD = 5
+    # Margen extra de reproducción que se agrega por cada evaluación con vacíos
+    UNDERRUN_STEP_MS = 10.0
+    # Fracción del margen que se conserva tras una evaluación sin vacíos
+    MARGIN_DECAY = 0.9
+
+    def __init__(self, frame_ms=20, min_delay_ms=20, max_delay_ms=300, interval=1.0):
+        self.frame_ms = min(FRAME_SIZES_MS, key=lambda size: abs(size - frame_ms))
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.interval = interval
+        self._margin_ms = 0.0
+        self._up = 0
+        self._down = 0
+        self._last_underruns = None
+
+    @property
+    def playout_delay_ms(self):
+        """Retardo mínimo que deben acumular los buffers de reproducción"""
+        delay = max(self.min_delay_ms, self.frame_ms) + self._margin_ms
+        return min(self.max_delay_ms, delay)
+
+    def update(self, jitter_ms, underruns, depth_ms=0.0):
+        """Incorporar una medición y devolver (frame_ms, playout_delay_ms)
+
+        `underruns` es el total acumulado de vacíos de la salida y
+        `depth_ms` lo que hay encolado para reproducir en el peor hablante.
+        """
+        new_underruns = 0
+        if self._last_underruns is not None:
+            new_underruns = max(0, underruns - self._last_underruns)
+        self._last_underruns = underruns
+
+        self._update_margin(new_underruns, depth_ms)
+        self._update_frame(jitter_ms, new_underruns)
+        return self.frame_ms, self.playout_delay_ms
+
+    def _update_margin(self, new_underruns, depth_ms):
+        if new_underruns:
+            self._margin_ms += self.UNDERRUN_STEP_MS
+        else:
+            self._margin_ms *= self.MARGIN_DECAY
+        # Si ya hay mucho encolado el problema no es la falta de margen
+        if depth_ms > 2 * self.playout_delay_ms:
+            self._margin_ms *= self.MARGIN_DECAY
+        self._margin_ms = min(self._margin_ms, float(self.max_delay_ms))
+
+    def _update_frame(self, jitter_ms, new_underruns):
+        index = FRAME_SIZES_MS.index(self.frame_ms)
+        wanted = self.JITTER_RATIO * jitter_ms
+        worse = self.frame_ms < wanted or new_underruns > 0
+        better = (
+            index > 0
+            and not new_underruns
+            and FRAME_SIZES_MS[index - 1] >= wanted * self.DOWN_MARGIN
+        )
+
+        if worse and index < len(FRAME_SIZES_MS) - 1:
+            self._up += 1
+            self._down = 0
+            if self._up >= self.UP_HOLD:
+                self.frame_ms = FRAME_SIZES_MS[index + 1]
+                self._up = 0
+        elif better:
+            self._down += 1
+            self._up = 0
+            if self._down >= self.DOWN_HOLD:
+                self.frame_ms = FRAME_SIZES_MS[index - 1]
+                self._down = 0
+        else:
+            self._up = 0
+            self._down = 0
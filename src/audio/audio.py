@@ -2,98 +2,276 @@ import sys
 import sounddevice as sd
 import numpy as np
 from PySide6.QtCore import QObject, Signal, QThread
-import queue
 import threading
 import time
 import platform
 import os
 import time
+from audio.adaptive import AdaptiveController, BASE_FRAME_MS, FRAME_SIZES_MS
+from audio.jitter import JitterBuffer
+from audio.rates import DEFAULT_WIRE_SAMPLERATE
+from audio.resample import Resampler
+from audio.vad import VoiceActivityDetector
 from utils.thread_utils import set_high_priority
 
+
+def pick_device_samplerate(input_device, output_device, channels, preferred=None):
+    """Primera frecuencia que aceptan los dos dispositivos
+
+    Se prueba primero `preferred` (así no hace falta remuestrear), luego las
+    habituales y por último la predeterminada del dispositivo de entrada.
+    """
+    candidates = [preferred, 48000, 44100]
+    try:
+        candidates.append(int(sd.query_devices(input_device, "input")["default_samplerate"]))
+    except Exception:
+        pass
+    for rate in candidates:
+        if not rate:
+            continue
+        try:
+            sd.check_input_settings(device=input_device, channels=channels, dtype=np.float32, samplerate=rate)
+            sd.check_output_settings(device=output_device, channels=channels, dtype=np.float32, samplerate=rate)
+            return rate
+        except Exception:
+            continue
+    return candidates[-1] or 48000
+
 class MicrophoneListener:
-    def __init__(self, samplerate=44100, channels=1, blocksize_ms=50, 
-                 input_device=None, output_device=None, monitor_gain=0.8, send_package=None, on_error=None, on_start=None, on_stop=None):
-        self.samplerate = samplerate
+    def __init__(self, samplerate=None, channels=1, blocksize_ms=50, 
+                 input_device=None, output_device=None, monitor_gain=0.8, send_package=None, on_error=None, on_start=None, on_stop=None,
+                 vad=True, latency_tracker=None, adaptive=True, duplex=True,
+                 wire_samplerate=DEFAULT_WIRE_SAMPLERATE):
+        # `samplerate` es la del dispositivo (None: la primera que acepte) y
+        # `wire_samplerate` la que se envía por la red y se anuncia en la
+        # cabecera de cada paquete
+        self.samplerate = samplerate or pick_device_samplerate(
+            input_device, output_device, channels, preferred=wire_samplerate
+        )
+        self.wire_samplerate = wire_samplerate
+        samplerate = self.samplerate
         self.channels = channels
-        self.blocksize = int(samplerate * (blocksize_ms / 1000.0))
+        self._send_resampler = Resampler(samplerate, wire_samplerate, channels)
+        # Un remuestreador por hablante remoto, solo usado por audio_queue_put
+        self._receive_resamplers = {}
+        # Los streams trabajan con bloques cortos fijos; el tamaño de trama que
+        # se envía lo decide el controlador adaptativo sin reabrirlos
+        self.blocksize = int(samplerate * (BASE_FRAME_MS / 1000.0))
+        self.adaptive = AdaptiveController(frame_ms=blocksize_ms) if adaptive else None
+        self.frame_ms = self.adaptive.frame_ms if adaptive else blocksize_ms
+        self._frame = np.zeros(
+            (int(samplerate * max(FRAME_SIZES_MS[-1], blocksize_ms) / 1000.0), channels),
+            dtype=np.float32,
+        )
+        self._frame_fill = 0
+        self._frame_length = 0  # Tamaño de la trama en curso, fijado al empezarla
         self.input_device = input_device
         self.output_device = output_device
         self.monitor_gain = monitor_gain  # Volumen del monitoreo (0.0 a 1.0)
         self._running = False
-        self.audio_queue = queue.Queue(maxsize=200)  # Aumentar tamaño para reducir underflow
+        # Un buffer de jitter por hablante remoto; el callback de salida los
+        # mezcla. El diccionario es de los hilos de red y de control (con
+        # _lock); el callback solo recorre `_mix_buffers`, una tupla que se
+        # reemplaza entera cuando entra o sale un hablante.
+        self._jitter_buffers = {}
+        self._mix_buffers = ()
+        self.speaker_timeout = 5.0  # Segundos sin audio para olvidar a un hablante
+        self._forgotten_starved = 0  # Vacíos de hablantes ya olvidados
+        # Supresión de silencio: los bloques sin voz no se envían
+        self.vad = VoiceActivityDetector(samplerate) if vad else None
+        # Trazado de latencia: número de secuencia de cada bloque enviado
+        self.latency_tracker = latency_tracker
+        self._seq = 0
         self.latency = 'low'  # Para reducir la latencia
         self.send_package = send_package  # Función para enviar datos al servidor
         self.on_error = on_error
         self.on_start = on_start
         self.on_stop = on_stop
+        # Dúplex: un solo sd.Stream captura y reproduce en el mismo periodo,
+        # con un único reloj de dispositivo. Si no se puede abrir, se usan
+        # dos streams separados como antes.
+        self.duplex = duplex
+        self._stream = None
         self._input_stream = None
         self._output_stream = None
-        self._lock = threading.Lock()  # Para sincronización
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()  # Entre hilos que no son de audio
         self._last_output_time = 0  # Para sincronización de salida
 
+    def _duplex_callback(self, indata, outdata, frames, pa_time, status):
+        """Callback del stream dúplex: captura y mezcla en el mismo periodo"""
+        if status:
+            self._report_status("Stream", status)
+        self._capture(indata, frames)
+        self._playback(outdata)
+
     def _input_callback(self, indata, frames, pa_time, status):
         """Callback para captura de micrófono"""
         if status:
-            # Solo mostrar overflow ocasionalmente para no saturar la consola
-            current_time = time.time()
-            if current_time - self._last_output_time > 1.0:  # Mostrar máximo una vez por segundo
-                print(f"Input status: {status}", file=sys.stderr)
-                self._last_output_time = current_time
+            self._report_status("Input", status)
+        self._capture(indata, frames)
 
+    def _report_status(self, kind, status):
+        # Solo mostrar overflow ocasionalmente para no saturar la consola
+        current_time = time.time()
+        if current_time - self._last_output_time > 1.0:  # Mostrar máximo una vez por segundo
+            print(f"{kind} status: {status}", file=sys.stderr)
+            self._last_output_time = current_time
+
+    def _capture(self, indata, frames):
         try:
-            # Enviar datos para procesamiento
-            if self.send_package:
-                self.send_package({"data": indata.copy()})
+            # Juntar bloques hasta completar una trama. El tamaño se fija al
+            # empezar cada trama: si el controlador adaptativo lo cambia a
+            # mitad de una, esa se completa con el tamaño anterior
+            pos = 0
+            while pos < frames:
+                if self._frame_fill == 0:
+                    self._frame_length = int(self.samplerate * self.frame_ms / 1000.0)
+                n = min(frames - pos, self._frame_length - self._frame_fill)
+                self._frame[self._frame_fill:self._frame_fill + n] = indata[pos:pos + n]
+                self._frame_fill += n
+                pos += n
+                if self._frame_fill >= self._frame_length:
+                    self._frame_fill = 0
+                    self._send_frame(self._frame[:self._frame_length])
         except Exception as e:
             if self.on_error:
                 self.on_error(f"Error en input callback: {e}")
+
+    def _send_frame(self, frame):
+        if self.vad is not None and not self.vad.is_speech(frame):
+            # Tras el silencio la voz empieza sin la historia de la anterior
+            self._send_resampler.reset()
+            return
+
+        # Enviar datos para procesamiento
+        if self.send_package:
+            self._seq += 1
+            self.send_package({
+                "data": self._send_resampler.process(frame),
+                "samplerate": self.wire_samplerate,
+                "seq": self._seq,
+                "captured": time.time(),
+            })
     
-    def audio_queue_put(self, indata):
-        """Agregar datos de audio a la cola de monitoreo"""
+    def audio_queue_put(self, indata, speaker=None, trace=None, samplerate=None):
+        """Agregar un bloque recibido al buffer de jitter de su hablante
+
+        `samplerate` es la de la cabecera del paquete; si no coincide con la
+        del dispositivo, el bloque se remuestrea antes de encolarlo.
+        """
         try:
-            # Si la cola está llena, eliminar el elemento más antiguo
-            if self.audio_queue.full():
-                try:
-                    self.audio_queue.get_nowait()
-                except queue.Empty:
-                    pass
-            
-            # Agregar los nuevos datos con el volumen aplicado
+            # La voz puede llegar de dos hilos a la vez (Socket.IO y UDP): el
+            # estado del remuestreador y el del buffer de cada hablante se
+            # actualizan con _lock, que no toma el callback de audio
             with self._lock:
-                gain = self.monitor_gain
-            
-            # Aplicar ganancia y asegurar que no hay clipping
-            audio_data = indata.copy() * gain
-            audio_data = np.clip(audio_data, -1.0, 1.0)  # Evitar clipping
-            
-            self.audio_queue.put(audio_data, block=False)
+                if samplerate and samplerate != self.samplerate:
+                    indata = self._resample_received(indata, speaker, samplerate)
+                buffer = self._jitter_buffers.get(speaker)
+                new_speaker = buffer is None
+                if new_speaker:
+                    buffer = JitterBuffer(self.samplerate, tracker=self.latency_tracker, channels=self.channels)
+                    if self.adaptive is not None:
+                        buffer.set_min_delay_ms(self.adaptive.playout_delay_ms)
+                    self._jitter_buffers[speaker] = buffer
+                buffer.push(indata, trace=trace, seq=trace.get("seq") if trace else None)
+                if new_speaker:
+                    # Después del push: un buffer sin ningún bloque todavía
+                    # parece callado hace rato y se olvidaría en el acto
+                    self._forget_speakers()
         except Exception as e:
             print(f"Error en audio_queue_put: {e}")
 
+    def _resample_received(self, indata, speaker, samplerate):
+        """Llevar un bloque recibido a la frecuencia del dispositivo. Con _lock tomado."""
+        resampler = self._receive_resamplers.get(speaker)
+        if resampler is None or resampler.src_rate != samplerate:
+            # Olvidar los de hablantes que ya no están
+            for gone in set(self._receive_resamplers) - set(self._jitter_buffers):
+                del self._receive_resamplers[gone]
+            resampler = Resampler(samplerate, self.samplerate, self.channels)
+            self._receive_resamplers[speaker] = resampler
+        return resampler.process(indata)
+
+    def _forget_speakers(self):
+        """Quitar los hablantes callados hace rato y publicar la tupla del callback
+
+        Se llama con _lock tomado, nunca desde el callback de audio.
+        """
+        now = time.monotonic()
+        for speaker, buffer in list(self._jitter_buffers.items()):
+            if now - buffer.last_push > self.speaker_timeout and not buffer.available:
+                self._forgotten_starved += buffer.starved
+                del self._jitter_buffers[speaker]
+        self._mix_buffers = tuple(self._jitter_buffers.values())
+
     def _output_callback(self, outdata, frames, pa_time, status):
-        """Callback para salida de audio (monitoreo)"""
+        """Callback para salida de audio"""
         if status:
             print(f"Output status: {status}", file=sys.stderr)
-        
+        self._playback(outdata)
+
+    def _playback(self, outdata):
+        """Mezclar en `outdata` todos los hablantes"""
+        outdata.fill(0)
+        now = time.monotonic()
+        # Sin lock: la tupla se lee de una vez y cada buffer es SPSC
+        for buffer in self._mix_buffers:
+            if buffer.read_into(outdata):
+                continue
+            if now - buffer.last_push <= self.speaker_timeout:
+                # El hablante está en silencio (VAD): ruido de confort
+                buffer.add_comfort_noise(outdata)
+
+        # Aplicar ganancia y evitar clipping de la mezcla, en el lugar
+        outdata *= self.monitor_gain
+        np.clip(outdata, -1.0, 1.0, out=outdata)
+
+    def _stream_options(self):
+        return dict(
+            samplerate=self.samplerate,
+            channels=self.channels,
+            blocksize=self.blocksize,
+            latency='low',
+            dtype=np.float32,
+            clip_off=False,  # Evitar clipping
+            dither_off=True   # Reducir ruido
+        )
+
+    def _open_duplex(self):
+        """Abrir un único stream de entrada y salida; False si no se puede"""
         try:
-            # Obtener datos de la cola para monitoreo
-            data = self.audio_queue.get_nowait()
-            if len(data) < len(outdata):
-                outdata[:len(data)] = data
-                outdata[len(data):] = 0  # Llenar con silencio
-            else:
-                outdata[:] = data[:len(outdata)]
-        except queue.Empty:
-            # Si no hay datos, llenar con silencio
-            outdata.fill(0)
-            # Solo mostrar underflow ocasionalmente para no saturar la consola
-            current_time = time.time()
-            if current_time - self._last_output_time > 1.0:  # Mostrar máximo una vez por segundo
-                self._last_output_time = current_time
+            self._stream = sd.Stream(
+                device=(self.input_device, self.output_device),
+                callback=self._duplex_callback,
+                **self._stream_options()
+            )
+            return True
+        except Exception as e:
+            # P. ej. dispositivos de APIs de audio distintas
+            print(f"No se pudo abrir el stream dúplex ({e}), usando streams separados")
+            self._stream = None
+            return False
+
+    def _open_separate(self):
+        # Crear stream de entrada con configuración optimizada
+        self._input_stream = sd.InputStream(
+            callback=self._input_callback,
+            device=self.input_device,
+            **self._stream_options()
+        )
+
+        # Crear stream de salida para monitoreo con configuración optimizada
+        self._output_stream = sd.OutputStream(
+            callback=self._output_callback,
+            device=self.output_device,
+            **self._stream_options()
+        )
 
     def run(self):
         """Ejecutar el listener de micrófono en un hilo de alta prioridad"""
         self._running = True
+        self._stop_event.clear()
         
         # Configurar la prioridad del hilo actual
         set_high_priority()
@@ -113,43 +291,23 @@ class MicrophoneListener:
                 output_name = "default"
             print(f"Input: {input_name}, Output: {output_name}")
 
-            # Crear stream de entrada con configuración optimizada
-            self._input_stream = sd.InputStream(
-                samplerate=self.samplerate,
-                channels=self.channels,
-                callback=self._input_callback,
-                blocksize=self.blocksize,
-                device=self.input_device,
-                latency='low',
-                dtype=np.float32,
-                clip_off=False,  # Evitar clipping
-                dither_off=True   # Reducir ruido
-            )
-            
-            # Crear stream de salida para monitoreo con configuración optimizada
-            self._output_stream = sd.OutputStream(
-                samplerate=self.samplerate,
-                channels=self.channels,
-                callback=self._output_callback,
-                blocksize=self.blocksize,
-                device=self.output_device,
-                latency='low',
-                dtype=np.float32,
-                clip_off=False,  # Evitar clipping
-                dither_off=True   # Reducir ruido
-            )
-            
+            if not (self.duplex and self._open_duplex()):
+                self._open_separate()
+
             print("Iniciando grabación y monitoreo...")
-            self._input_stream.start()
-            self._output_stream.start()
-            
+            for stream in (self._stream, self._input_stream, self._output_stream):
+                if stream is not None:
+                    stream.start()
+
             if self.on_start:
                 self.on_start()
 
-            # Bucle principal con menor latencia
-            while self._running:
-                time.sleep(0.001)  # 1ms de latencia en lugar de 10ms
-            
+            # Esperar a stop() sin ocupar la CPU; el controlador adaptativo
+            # se evalúa en cada intervalo
+            interval = self.adaptive.interval if self.adaptive is not None else None
+            while not self._stop_event.wait(interval):
+                self._adapt()
+
         except Exception as e:
             error_msg = f"Error en MicrophoneListener: {e}"
             print(error_msg, file=sys.stderr)
@@ -162,8 +320,18 @@ class MicrophoneListener:
         """Detener el listener de micrófono"""
         if self._running:
             self._running = False
-            
+            # Despertar al hilo de run()
+            self._stop_event.set()
+
             # Detener streams de audio
+            if self._stream:
+                try:
+                    self._stream.stop()
+                    self._stream.close()
+                except:
+                    pass
+                self._stream = None
+
             if self._input_stream:
                 try:
                     self._input_stream.stop()
@@ -180,12 +348,10 @@ class MicrophoneListener:
                     pass
                 self._output_stream = None
             
-            # Limpiar la cola de audio
-            while not self.audio_queue.empty():
-                try:
-                    self.audio_queue.get_nowait()
-                except queue.Empty:
-                    break
+            # Limpiar los buffers de los hablantes
+            with self._lock:
+                self._jitter_buffers.clear()
+                self._mix_buffers = ()
             
             if self.on_stop:
                 self.on_stop()
@@ -195,6 +361,36 @@ class MicrophoneListener:
         return self._running
 
     def set_monitor_gain(self, gain):
-        """Ajustar el volumen del monitoreo de forma thread-safe"""
+        """Ajustar el volumen del monitoreo (el callback lee el valor sin lock)"""
+        self.monitor_gain = max(0.0, min(1.0, gain))
+
+    def _adapt(self):
+        """Ajustar tamaño de trama y retardo de reproducción a la red medida"""
+        with self._lock:
+            self._forget_speakers()
+            buffers = list(self._jitter_buffers.values())
+            jitter_ms = max((b.jitter * 1000.0 for b in buffers), default=0.0)
+            starved = sum(b.starved for b in buffers) + self._forgotten_starved
+            depth_ms = max((b.available * 1000.0 / self.samplerate for b in buffers), default=0.0)
+        frame_ms, delay_ms = self.adaptive.update(jitter_ms, starved, depth_ms)
+        if frame_ms != self.frame_ms:
+            print(f"Tamaño de trama: {self.frame_ms} ms -> {frame_ms} ms (jitter {jitter_ms:.1f} ms)")
+            # El callback de entrada toma el nuevo tamaño en la próxima trama
+            self.frame_ms = frame_ms
+        with self._lock:
+            for buffer in self._jitter_buffers.values():
+                buffer.set_min_delay_ms(delay_ms)
+
+    def jitter_stats(self):
+        """Contadores de recepción por hablante"""
         with self._lock:
-            self.monitor_gain = max(0.0, min(1.0, gain))
\ No newline at end of file
+            return {
+                speaker: {
+                    "jitter_ms": buffer.jitter * 1000.0,
+                    "underruns": buffer.underruns,
+                    "dropped": buffer.dropped,
+                    "concealed": buffer.concealed,
+                    "late": buffer.late,
+                }
+                for speaker, buffer in self._jitter_buffers.items()
+            }
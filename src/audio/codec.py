@@ -0,0 +1,93 @@
+import numpy as np
+
+# Capa de códecs de voz.
+#
+# Cada códec trabaja sobre muestras float32 intercaladas en [-1, 1] y tiene
+# un identificador de un byte que viaja en la cabecera del paquete
+# (ver audio/frame.py), de modo que el receptor siempre sabe decodificar
+# aunque el códec de la sala cambie a mitad de la llamada.
+
+
+class Codec:
+    """Interfaz base de un códec de voz"""
+    name = None
+    codec_id = None
+    bytes_per_sample = None
+
+    def encode(self, samples):
+        """Codificar muestras float32 intercaladas a bytes"""
+        raise NotImplementedError
+
+    def decode(self, payload, count, offset=0):
+        """Decodificar `count` muestras desde `payload` a float32"""
+        raise NotImplementedError
+
+    def payload_size(self, count):
+        """Bytes que ocupan `count` muestras codificadas"""
+        return count * self.bytes_per_sample
+
+
+class Float32Codec(Codec):
+    """PCM float32 sin compresión"""
+    name = "pcm_f32"
+    codec_id = 0
+    bytes_per_sample = 4
+
+    def encode(self, samples):
+        return np.asarray(samples, dtype="<f4").tobytes()
+
+    def decode(self, payload, count, offset=0):
+        return np.frombuffer(payload, dtype="<f4", count=count, offset=offset).astype(np.float32)
+
+
+class Pcm16Codec(Codec):
+    """PCM lineal de 16 bits"""
+    name = "pcm16"
+    codec_id = 1
+    bytes_per_sample = 2
+
+    def encode(self, samples):
+        pcm = np.clip(samples, -1.0, 1.0) * 32767.0
+        return pcm.astype("<i2").tobytes()
+
+    def decode(self, payload, count, offset=0):
+        pcm = np.frombuffer(payload, dtype="<i2", count=count, offset=offset)
+        return pcm.astype(np.float32) * (1.0 / 32767.0)
+
+
+class MuLawCodec(Codec):
+    """Ley mu (mu=255) de 8 bits, vectorizada con NumPy"""
+    name = "mulaw"
+    codec_id = 2
+    bytes_per_sample = 1
+
+    MU = 255.0
+    _LOG1P_MU = np.log1p(MU)
+
+    def encode(self, samples):
+        x = np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0)
+        y = np.sign(x) * (np.log1p(self.MU * np.abs(x)) / self._LOG1P_MU)
+        # [-1, 1] -> [0, 255]
+        return np.rint((y + 1.0) * 127.5).astype(np.uint8).tobytes()
+
+    def decode(self, payload, count, offset=0):
+        q = np.frombuffer(payload, dtype=np.uint8, count=count, offset=offset)
+        y = q.astype(np.float32) * (1.0 / 127.5) - 1.0
+        return (np.sign(y) * np.expm1(np.abs(y) * self._LOG1P_MU) / self.MU).astype(np.float32)
+
+
+CODECS = {codec.name: codec for codec in (MuLawCodec(), Pcm16Codec(), Float32Codec())}
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+
+# Orden de preferencia que anuncia el cliente al entrar a una sala
+CODEC_PREFERENCE = ["mulaw", "pcm16", "pcm_f32"]
+# Códec que todos los clientes entienden; se usa si la negociación falla
+DEFAULT_CODEC = "pcm16"
+
+
+def get_codec(name):
+    """Obtener un códec por nombre (o por identificador numérico)"""
+    codec = CODECS_BY_ID.get(name) if isinstance(name, int) else CODECS.get(name)
+    if codec is None:
+        raise KeyError(f"Códec desconocido: {name}")
+    return codec
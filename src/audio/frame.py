@@ -0,0 +1,122 @@
+import struct
+from collections import namedtuple
+import numpy as np
+from audio.codec import CODECS_BY_ID, DEFAULT_CODEC, get_codec
+
+# Formato binario de los paquetes del evento 'voice'.
+#
+# Cada paquete es una cabecera fija seguida de las muestras intercaladas
+# codificadas con el códec indicado. Se envía como adjunto binario de
+# Socket.IO, así que el servidor puede reenviarlo byte a byte sin
+# decodificarlo.
+#
+#   version     uint8   FRAME_VERSION
+#   codec       uint8   identificador del códec (ver audio/codec.py)
+#   channels    uint8
+#   (relleno)   uint8
+#   samplerate  uint32
+#   frames      uint32  muestras por canal
+#   seq         uint32  número de secuencia del emisor
+#   timestamp   float64 hora de captura (time.time(), segundos)
+#
+# Un paquete puede llevar varias tramas seguidas (cabecera + audio cada una):
+# el emisor las junta cuando se le acumulan envíos (ver `join_frames`). El
+# largo de cada trama sale de su cabecera, así que no hace falta otro campo.
+
+FRAME_VERSION = 2
+
+_HEADER = struct.Struct("<BBBxIIId")
+HEADER_SIZE = _HEADER.size
+# Posición del número de secuencia dentro de la cabecera
+_SEQ = struct.Struct("<I")
+_SEQ_OFFSET = struct.calcsize("<BBBxII")
+
+FrameHeader = namedtuple(
+    "FrameHeader", "version codec_id channels samplerate frames seq timestamp"
+)
+
+
+class FrameError(ValueError):
+    """Paquete de voz con formato inválido"""
+
+
+def encode_frame(data, samplerate, codec=DEFAULT_CODEC, seq=0, timestamp=0.0):
+    """Serializar un bloque de audio float32 (frames, canales) a bytes"""
+    if isinstance(codec, (str, int)):
+        codec = get_codec(codec)
+    data = np.asarray(data, dtype=np.float32)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+    frames, channels = data.shape
+
+    header = _HEADER.pack(
+        FRAME_VERSION, codec.codec_id, channels, int(samplerate), frames,
+        seq & 0xFFFFFFFF, timestamp,
+    )
+    return header + codec.encode(data.reshape(-1))
+
+
+def with_seq(payload, seq):
+    """Copia de un paquete ya codificado con otro número de secuencia
+
+    Sirve para mandar la misma trama a varios destinatarios, cada uno con su
+    propia numeración, sin volver a codificar el audio.
+    """
+    data = bytearray(payload)
+    _SEQ.pack_into(data, _SEQ_OFFSET, seq & 0xFFFFFFFF)
+    return bytes(data)
+
+
+def read_header(payload):
+    """Leer solo la cabecera del paquete"""
+    if len(payload) < HEADER_SIZE:
+        raise FrameError("Paquete demasiado corto")
+    header = FrameHeader(*_HEADER.unpack_from(payload))
+    if header.version != FRAME_VERSION:
+        raise FrameError(f"Versión de paquete no soportada: {header.version}")
+    return header
+
+
+def _decode_at(payload, offset):
+    """Decodificar la trama que empieza en `offset`; devuelve también su fin"""
+    if len(payload) - offset < HEADER_SIZE:
+        raise FrameError("Paquete demasiado corto")
+    header = FrameHeader(*_HEADER.unpack_from(payload, offset))
+    if header.version != FRAME_VERSION:
+        raise FrameError(f"Versión de paquete no soportada: {header.version}")
+    codec = CODECS_BY_ID.get(header.codec_id)
+    if codec is None or header.channels == 0:
+        raise FrameError(f"Códec desconocido: {header.codec_id}")
+
+    count = header.frames * header.channels
+    size = codec.payload_size(count)
+    start = offset + HEADER_SIZE
+    if len(payload) - start < size:
+        raise FrameError("Paquete truncado")
+
+    data = codec.decode(payload, count, offset=start)
+    return data.reshape(header.frames, header.channels), header, start + size
+
+
+def decode_frame(payload):
+    """Reconstruir (audio float32 (frames, canales), cabecera) desde bytes
+
+    Con un paquete de varias tramas devuelve solo la primera.
+    """
+    data, header, _ = _decode_at(payload, 0)
+    return data, header
+
+
+def join_frames(frames):
+    """Juntar varias tramas ya codificadas en un único paquete"""
+    return b"".join(frames)
+
+
+def decode_frames(payload):
+    """Decodificar todas las tramas del paquete como [(audio, cabecera)]"""
+    frames = []
+    offset = 0
+    while offset < len(payload):
+        data, header, offset = _decode_at(payload, offset)
+        frames.append((data, header))
+    return frames
@@ -0,0 +1,306 @@
+import time
+from collections import deque
+import numpy as np
+from audio.ring import AudioRing
+from utils.latency import DEQUEUE_TO_PLAYOUT, END_TO_END
+
+# Buffer de jitter adaptativo por hablante.
+#
+# Cada hablante remoto tiene su propio buffer. El callback de salida lee de
+# todos ellos en cada periodo y suma lo que leen (mezcla), así que varios
+# hablantes ya no se intercalan en una única cola.
+#
+# Los bloques numerados se reordenan dentro de una ventana pequeña. Los que
+# no llegan se ocultan repitiendo el último periodo de tono del bloque
+# anterior con un desvanecimiento progresivo, en lugar de dejar un hueco.
+#
+# `push` corre en el hilo de red y `read_into` en el callback de audio, sin
+# lock entre ellos: las muestras pasan por un AudioRing preasignado (ver
+# audio/ring.py) y cada lado solo modifica su propio estado. El reordenamiento
+# y la ocultación son del productor; el arranque, los vacíos y el recorte del
+# retardo excesivo, del consumidor.
+
+_SEQ_MASK = 0xFFFFFFFF
+# Saltos de secuencia mayores se toman como un reinicio del emisor
+_SEQ_RESYNC = 64
+
+
+class JitterBuffer:
+    """Buffer de reproducción de un hablante con retardo objetivo adaptativo"""
+
+    # Nivel máximo (RMS) del ruido de confort, unos -40 dBFS
+    MAX_COMFORT_NOISE = 0.01
+    # Bloques fuera de orden que se esperan antes de dar uno por perdido
+    REORDER_WINDOW = 3
+    # Bloques perdidos seguidos que se ocultan; a partir de ahí, silencio
+    MAX_CONCEALED = 5
+    # Ganancia que se aplica por cada bloque oculto seguido
+    CONCEAL_FADE = 0.6
+    # Rango de periodos de tono que se buscan para la repetición (Hz)
+    PITCH_RANGE = (66, 500)
+    # Un vacío seguido de un paquete antes de este hueco (s) fue por la red;
+    # con huecos mayores el hablante simplemente dejó de hablar (VAD)
+    STARVED_GAP = 0.25
+
+    def __init__(self, samplerate, min_delay_ms=20, max_delay_ms=300, tracker=None, channels=1):
+        self.samplerate = samplerate
+        self.tracker = tracker  # LatencyTracker opcional (ver utils/latency.py)
+        self.min_delay = int(samplerate * min_delay_ms / 1000)
+        self.max_delay = int(samplerate * max_delay_ms / 1000)
+        # Lugar para el doble del retardo máximo más bloques en tránsito
+        self._ring = AudioRing(4 * self.max_delay, channels)
+        # (posición de escritura donde empieza el bloque, traza)
+        self._marks = deque()
+        # Muestras máximas acumuladas antes de que el consumidor recorte
+        self._limit = self.max_delay
+        self._playing = False
+        # Ruido de confort: buffer reutilizado entre periodos
+        self._noise = np.zeros((0, channels), dtype=np.float32)
+        # Estimación de jitter entre llegadas (RFC 3550), en segundos
+        self.jitter = 0.0
+        self._last_arrival = None
+        self._last_duration = 0.0
+        self._last_seq = None
+        self._last_captured = None
+        self.last_push = 0.0
+        self.underruns = 0
+        # Vacíos por paquetes atrasados (no por pausas del hablante)
+        self.starved = 0
+        self._underrun_pending = False
+        self.dropped = 0
+        self.overflowed = 0  # Muestras que no entraron en el ring
+        # Reordenamiento por número de secuencia
+        self._next_seq = None
+        self._pending = {}  # seq -> (bloque, traza) llegados antes de tiempo
+        self._last_frame = None
+        self._lost_run = 0  # Bloques ocultos seguidos
+        self.concealed = 0
+        self.late = 0
+        # Nivel del ruido de fondo del hablante, estimado con sus bloques más suaves
+        self.noise_level = 0.0
+        self._rng = np.random.default_rng()
+
+    @property
+    def available(self):
+        return self._ring.available
+
+    def set_min_delay_ms(self, delay_ms):
+        """Cambiar el retardo mínimo de reproducción (ver audio/adaptive.py)"""
+        self.min_delay = min(self.max_delay, int(self.samplerate * delay_ms / 1000))
+
+    @property
+    def target_delay(self):
+        """Muestras a acumular antes de empezar a reproducir"""
+        delay = int((self._last_duration + 3 * self.jitter) * self.samplerate)
+        return max(self.min_delay, min(self.max_delay, delay))
+
+    def push(self, data, now=None, trace=None, seq=None):
+        """Agregar un bloque (frames, canales) recibido de la red
+
+        `trace` lleva la hora de recepción ("dequeued", monótona) y de
+        captura ("captured", de pared) para medir la latencia de salida.
+        Con `seq` el bloque se reordena y los huecos se ocultan.
+        """
+        now = time.monotonic() if now is None else now
+        captured = trace.get("captured") if trace else None
+        if self._last_arrival is not None and not self._after_break(now, captured, seq):
+            deviation = abs((now - self._last_arrival) - self._last_duration)
+            self.jitter += (deviation - self.jitter) / 16.0
+        if self._underrun_pending and now - self.last_push < self.STARVED_GAP:
+            self.starved += 1
+        self._underrun_pending = False
+        self._last_arrival = now
+        self._last_duration = len(data) / self.samplerate
+        self._last_seq = seq
+        self._last_captured = captured
+        self.last_push = now
+
+        rms = float(np.sqrt(np.mean(np.square(data))))
+        if self.noise_level == 0.0 or rms < self.noise_level:
+            self.noise_level = rms
+        else:
+            self.noise_level *= 1.05
+        self.noise_level = min(self.noise_level, self.MAX_COMFORT_NOISE)
+
+        if seq is None:
+            self._append(data, trace)
+        else:
+            self._push_ordered(data, trace, seq)
+            if self._pending and self._ring.available < len(data):
+                # El ring se vacía antes del próximo paquete: no esperar
+                # más al que falta
+                self._skip_gap()
+
+        # Si el retardo acumulado se dispara, el consumidor descarta lo más
+        # antiguo (ver read_into)
+        self._limit = 2 * self.target_delay + len(data)
+
+    def _after_break(self, now, captured, seq):
+        """¿El bloque sigue a una pausa del emisor o a un salto de secuencia?
+
+        El hueco entre llegadas después de un silencio (VAD/DTX) o de bloques
+        perdidos no es jitter de la red: no entra en la estimación.
+        """
+        if seq is not None and self._last_seq is not None and seq != (self._last_seq + 1) & _SEQ_MASK:
+            return True
+        if captured and self._last_captured:
+            # El emisor no mandó nada entre los dos bloques (con margen para
+            # bloques que el dispositivo entrega de a dos)
+            return captured - self._last_captured > 2.5 * self._last_duration
+        return now - self._last_arrival > self.STARVED_GAP
+
+    def _push_ordered(self, data, trace, seq):
+        if self._next_seq is None:
+            self._next_seq = seq
+        ahead = (seq - self._next_seq) & _SEQ_MASK
+        if ahead >= 1 << 31:
+            # Llegó después de que su hueco se ocultara (o duplicado)
+            if (self._next_seq - seq) & _SEQ_MASK <= _SEQ_RESYNC:
+                self.late += 1
+                return
+            ahead = _SEQ_RESYNC + 1
+        if ahead > _SEQ_RESYNC:
+            # El emisor reinició su numeración: empezar de nuevo
+            self._flush_pending()
+            self._next_seq = seq
+
+        self._pending[seq] = (data, trace)
+        self._release_pending()
+        if len(self._pending) > self.REORDER_WINDOW:
+            self._skip_gap()
+
+    def _release_pending(self):
+        """Pasar a la cola los bloques consecutivos disponibles"""
+        while self._next_seq in self._pending:
+            data, trace = self._pending.pop(self._next_seq)
+            self._append(data, trace)
+            self._next_seq = (self._next_seq + 1) & _SEQ_MASK
+
+    def _skip_gap(self):
+        """Dar por perdidos los bloques que faltan hasta el siguiente recibido"""
+        if not self._pending:
+            return
+        following = min(self._pending, key=lambda s: (s - self._next_seq) & _SEQ_MASK)
+        missing = (following - self._next_seq) & _SEQ_MASK
+        for _ in range(missing):
+            self._append_concealment()
+        self._next_seq = following
+        self._release_pending()
+
+    def _flush_pending(self):
+        while self._pending:
+            self._skip_gap()
+
+    def _append(self, data, trace):
+        if self._lost_run and self._last_frame is not None:
+            data = self._fade_in(data)
+        self._lost_run = 0
+        self._last_frame = data
+        self._write(data, trace)
+
+    def _write(self, data, trace):
+        if trace is not None and self.tracker is not None:
+            self._marks.append((self._ring.write_position, trace))
+        written = self._ring.write(data)
+        self.overflowed += len(data) - written
+
+    def _append_concealment(self):
+        self._lost_run += 1
+        if self._last_frame is None or self._lost_run > self.MAX_CONCEALED:
+            return
+        self._write(self._conceal(self._last_frame, self._lost_run), None)
+        self.concealed += 1
+
+    def _conceal(self, last, run):
+        """Repetir el último periodo de tono de `last` con desvanecimiento"""
+        frames = len(last)
+        period = self._pitch_period(last.mean(axis=1))
+        cycle = last[-period:]
+        repeated = np.tile(cycle, (-(-frames // period), 1))[:frames]
+        gain = np.linspace(
+            self.CONCEAL_FADE ** (run - 1), self.CONCEAL_FADE ** run, frames, dtype=np.float32
+        )
+        return repeated * gain[:, np.newaxis]
+
+    def _pitch_period(self, mono):
+        """Periodo (en muestras) de máxima autocorrelación dentro de PITCH_RANGE"""
+        n = len(mono)
+        low = max(1, int(self.samplerate / self.PITCH_RANGE[1]))
+        high = min(n // 2, int(self.samplerate / self.PITCH_RANGE[0]))
+        if high <= low:
+            return n
+        spectrum = np.fft.rfft(mono, 2 * n)
+        corr = np.fft.irfft(spectrum * np.conj(spectrum))[:high + 1]
+        if corr[0] <= 1e-9:
+            return n
+        lag = low + int(np.argmax(corr[low:high + 1]))
+        # Sin periodicidad clara (ruido): repetir el bloque entero
+        return lag if corr[lag] > 0.3 * corr[0] else n
+
+    def _fade_in(self, data):
+        """Rampa corta al volver de un hueco para evitar el chasquido"""
+        length = min(len(data), int(self.samplerate * 0.005))
+        data = np.array(data, dtype=np.float32)
+        data[:length] *= np.linspace(0.0, 1.0, length, dtype=np.float32)[:, np.newaxis]
+        return data
+
+    def read_into(self, out):
+        """Sumar el siguiente periodo del hablante en `out`
+
+        Devuelve False si el buffer todavía se está llenando o se vació.
+        Corre en el callback de audio: no toma locks ni reserva muestras.
+        """
+        ring = self._ring
+        if not self._playing:
+            if ring.available < self.target_delay:
+                return False
+            self._playing = True
+
+        excess = ring.available - self._limit
+        if excess > 0:
+            # Descartar al menos un bloque entero, como mínimo lo que sobra
+            block = max(1, int(self._last_duration * self.samplerate))
+            ring.skip(max(excess, block))
+            # Los bloques descartados no se miden
+            while self._marks and self._marks[0][0] < ring.read_position:
+                self._marks.popleft()
+            self.dropped += -(-excess // block)
+
+        start = ring.read_position
+        frames = ring.add_into(out)
+        if self._marks:
+            self._trace_marks(start + frames)
+
+        if frames < len(out):
+            # Se vació: volver a acumular antes de seguir reproduciendo
+            self._playing = False
+            self.underruns += 1
+            self._underrun_pending = True
+        return frames > 0
+
+    def _trace_marks(self, position):
+        """Medir la salida de los bloques que empezaron antes de `position`"""
+        while self._marks and self._marks[0][0] < position:
+            _, trace = self._marks.popleft()
+            self._trace_playout(trace)
+
+    def _trace_playout(self, trace):
+        self.tracker.record(DEQUEUE_TO_PLAYOUT, time.monotonic() - trace["dequeued"])
+        if trace.get("captured"):
+            self.tracker.record(END_TO_END, time.time() - trace["captured"])
+
+    def add_comfort_noise(self, out):
+        """Sumar ruido de confort al nivel de fondo del hablante
+
+        El emisor deja de enviar durante el silencio (VAD); en lugar de un
+        silencio digital absoluto se reproduce un ruido suave parecido al
+        fondo real.
+        """
+        if self.noise_level > 0.0:
+            if len(self._noise) < len(out):
+                # Solo la primera vez (o si crece el periodo)
+                self._noise = np.zeros(out.shape, dtype=np.float32)
+            noise = self._noise[:len(out)]
+            self._rng.standard_normal(out=noise, dtype=np.float32)
+            noise *= self.noise_level
+            out += noise
@@ -0,0 +1,32 @@
+import numpy as np
+
+# Mezcla vectorizada de varios hablantes.
+
+
+def stack_frames(frames, length, channels):
+    """Apilar bloques (frames, canales) en un array (hablantes, length, canales)
+
+    Los bloques más cortos se rellenan con silencio y los más largos se
+    recortan, para poder sumarlos de una vez.
+    """
+    stacked = np.zeros((len(frames), length, channels), dtype=np.float32)
+    for i, frame in enumerate(frames):
+        n = min(length, frame.shape[0])
+        c = min(channels, frame.shape[1])
+        stacked[i, :n, :c] = frame[:n, :c]
+    return stacked
+
+
+def mix(stacked):
+    """Sumar todos los hablantes y recortar a [-1, 1]"""
+    return np.clip(stacked.sum(axis=0), -1.0, 1.0)
+
+
+def mix_minus(stacked):
+    """Mezcla total y, por hablante, la mezcla sin su propia voz
+
+    Devuelve (total, parciales) donde parciales[i] = total - stacked[i].
+    """
+    total = stacked.sum(axis=0)
+    partial = total[np.newaxis] - stacked
+    return np.clip(total, -1.0, 1.0), np.clip(partial, -1.0, 1.0)
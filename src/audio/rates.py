@@ -0,0 +1,8 @@
+# Frecuencias de muestreo de la voz en la red (la que va en la cabecera de
+# cada paquete, ver audio/frame.py).
+#
+# Viven en un módulo sin NumPy para que la ventana pueda ofrecerlas al
+# arrancar sin cargar la parte de audio (ver window/home.py).
+
+WIRE_SAMPLERATES = (16000, 24000, 48000)
+DEFAULT_WIRE_SAMPLERATE = 16000
@@ -0,0 +1,75 @@
+from math import gcd
+import numpy as np
+
+# Remuestreo polifásico vectorizado.
+#
+# Convierte entre la frecuencia del dispositivo y la de la red (la que va en
+# la cabecera del paquete, ver audio/frame.py). El filtro paso bajo se
+# reparte en L fases; cada muestra de salida usa una sola fase, así que el
+# costo es de TAPS multiplicaciones por muestra y por canal. Cada bloque se
+# procesa de una vez con NumPy y el estado (historia y fase) se conserva
+# entre bloques para que no haya discontinuidades.
+
+
+class Resampler:
+    """Remuestreador en streaming de `src_rate` a `dst_rate`"""
+
+    # Coeficientes por fase (a la frecuencia de entrada)
+    TAPS = 24
+    # Parámetro de la ventana de Kaiser (~80 dB de rechazo)
+    KAISER_BETA = 8.0
+
+    def __init__(self, src_rate, dst_rate, channels=1):
+        self.src_rate = int(src_rate)
+        self.dst_rate = int(dst_rate)
+        self.channels = channels
+        g = gcd(self.src_rate, self.dst_rate)
+        self.up = self.dst_rate // g
+        self.down = self.src_rate // g
+        self._phases = self._design(self.up, self.down)
+        self._history = np.zeros((self.TAPS - 1, channels), dtype=np.float32)
+        # Posición de la próxima salida dentro del bloque siguiente, en
+        # unidades de 1/up muestras de entrada
+        self._position = 0
+        self._taps = np.arange(self.TAPS)
+
+    @property
+    def passthrough(self):
+        return self.up == self.down
+
+    def _design(self, up, down):
+        """Filtro sinc con ventana de Kaiser, repartido en `up` fases"""
+        length = self.TAPS * up
+        cutoff = 0.5 / max(up, down)  # Relativo a la frecuencia sobremuestreada
+        t = np.arange(length) - (length - 1) / 2.0
+        prototype = 2.0 * cutoff * np.sinc(2.0 * cutoff * t) * np.kaiser(length, self.KAISER_BETA)
+        # Ganancia `up` en total: cada fase suma ~1
+        prototype *= up / prototype.sum()
+        # phases[p, j] multiplica a x[k - j] en las salidas de fase p
+        return prototype.reshape(self.TAPS, up).T.astype(np.float32)
+
+    def process(self, block):
+        """Remuestrear un bloque (frames, canales) y devolver el resultado"""
+        if self.passthrough:
+            return block
+        block = np.asarray(block, dtype=np.float32)
+        frames = len(block)
+        buffer = np.concatenate((self._history, block[:, :self.channels]))
+
+        span = frames * self.up - self._position
+        count = max(0, -(-span // self.down))
+        positions = self._position + np.arange(count) * self.down
+        index = positions // self.up
+        phase = positions % self.up
+
+        # (count, TAPS, canales): las TAPS muestras de entrada de cada salida
+        window = buffer[(self.TAPS - 1) + index[:, np.newaxis] - self._taps]
+        out = np.einsum("ntc,nt->nc", window, self._phases[phase])
+
+        self._position += count * self.down - frames * self.up
+        self._history = buffer[len(buffer) - (self.TAPS - 1):]
+        return out
+
+    def reset(self):
+        self._history[:] = 0.0
+        self._position = 0
@@ -0,0 +1,68 @@
+import numpy as np
+
+# Ring de muestras preasignado para el camino de reproducción.
+#
+# Un solo productor (el hilo que recibe de la red) y un solo consumidor (el
+# callback de audio). Cada lado solo modifica su propio contador: el
+# productor copia las muestras y después publica `_write`; el consumidor lee
+# en el lugar y después publica `_read`. Con el GIL la asignación de un
+# atributo es atómica, así que no hacen falta locks y en cada periodo no se
+# reserva memoria para muestras.
+
+
+class AudioRing:
+    """Ring SPSC de `capacity` muestras (frames, canales) en float32"""
+
+    def __init__(self, capacity, channels):
+        self.capacity = capacity
+        self._data = np.zeros((capacity, channels), dtype=np.float32)
+        # Contadores totales (no índices): la posición es contador % capacity
+        self._write = 0  # Solo lo modifica el productor
+        self._read = 0  # Solo lo modifica el consumidor
+
+    @property
+    def available(self):
+        """Muestras escritas que el consumidor todavía no leyó"""
+        return self._write - self._read
+
+    @property
+    def write_position(self):
+        return self._write
+
+    @property
+    def read_position(self):
+        return self._read
+
+    def write(self, data):
+        """Copiar `data` al ring; devuelve cuántas muestras entraron. Solo el productor."""
+        frames = min(len(data), self.capacity - (self._write - self._read))
+        if frames <= 0:
+            return 0
+        channels = self._data.shape[1]
+        start = self._write % self.capacity
+        first = min(frames, self.capacity - start)
+        self._data[start:start + first] = data[:first, :channels]
+        if frames > first:
+            self._data[:frames - first] = data[first:frames, :channels]
+        self._write += frames
+        return frames
+
+    def add_into(self, out):
+        """Sumar en `out` las siguientes muestras; devuelve cuántas. Solo el consumidor."""
+        frames = min(len(out), self._write - self._read)
+        if frames <= 0:
+            return 0
+        channels = out.shape[1]
+        start = self._read % self.capacity
+        first = min(frames, self.capacity - start)
+        out[:first] += self._data[start:start + first, :channels]
+        if frames > first:
+            out[first:frames] += self._data[:frames - first, :channels]
+        self._read += frames
+        return frames
+
+    def skip(self, frames):
+        """Descartar hasta `frames` muestras sin leerlas. Solo el consumidor."""
+        frames = max(0, min(frames, self._write - self._read))
+        self._read += frames
+        return frames
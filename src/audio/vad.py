@@ -0,0 +1,68 @@
+from collections import deque
+import numpy as np
+
+# Detección de actividad de voz (VAD) para no enviar bloques de silencio.
+
+
+class VoiceActivityDetector:
+    """VAD por energía y tasa de cruces por cero, con hangover
+
+    El umbral se mide respecto a un piso de ruido por estadística de mínimos:
+    la menor energía de los últimos `floor_window_ms`, se hable o no. Así un
+    ruido de fondo constante (zumbido de la red, ventiladores) sube el piso
+    en unos segundos y deja de contar como voz, mientras que las pausas entre
+    palabras mantienen el piso abajo. El hangover mantiene el envío activo un
+    rato después de hablar para no cortar el final de las palabras.
+    """
+
+    # Subventanas en las que se divide la ventana del piso de ruido
+    FLOOR_SUBWINDOWS = 8
+
+    def __init__(self, samplerate, threshold_db=9.0, min_energy_db=-55.0,
+                 max_zero_crossing=0.35, hangover_ms=300, floor_window_ms=3000):
+        self.samplerate = samplerate
+        self.threshold_db = threshold_db
+        self.min_energy_db = min_energy_db
+        self.max_zero_crossing = max_zero_crossing
+        self.hangover = hangover_ms / 1000.0
+        self.floor_subwindow = floor_window_ms / 1000.0 / self.FLOOR_SUBWINDOWS
+        self._minima = deque(maxlen=self.FLOOR_SUBWINDOWS - 1)  # Mínimos de subventanas cerradas
+        self.reset()
+
+    def is_speech(self, block):
+        """Decidir si el bloque (frames, canales) debe enviarse"""
+        x = block[:, 0] if block.ndim > 1 else block
+        energy_db = 10.0 * np.log10(np.dot(x, x) / max(len(x), 1) + 1e-12)
+        # El ruido blanco cruza por cero mucho más que la voz
+        zero_crossing = np.count_nonzero(np.signbit(x[1:]) != np.signbit(x[:-1])) / max(len(x) - 1, 1)
+
+        duration = len(x) / self.samplerate
+        self._track_floor(energy_db, duration)
+
+        threshold = max(self.noise_floor_db + self.threshold_db, self.min_energy_db)
+        active = energy_db > threshold and zero_crossing < self.max_zero_crossing
+
+        if active:
+            self._hang_left = self.hangover
+        else:
+            self._hang_left = max(0.0, self._hang_left - duration)
+
+        return active or self._hang_left > 0.0
+
+    def _track_floor(self, energy_db, duration):
+        # Mínimo de la subventana en curso; al cerrarla pasa a la ventana y
+        # la más vieja se descarta
+        self._current_min = min(self._current_min, energy_db)
+        self._current_time += duration
+        if self._current_time >= self.floor_subwindow:
+            self._minima.append(self._current_min)
+            self._current_min = np.inf
+            self._current_time = 0.0
+        self.noise_floor_db = min(self._current_min, min(self._minima, default=np.inf))
+
+    def reset(self):
+        self.noise_floor_db = self.min_energy_db
+        self._minima.clear()
+        self._current_min = np.inf
+        self._current_time = 0.0
+        self._hang_left = 0.0
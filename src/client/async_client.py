@@ -0,0 +1,211 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from urllib.parse import urlparse
+import socketio
+from audio.codec import DEFAULT_CODEC, get_codec
+from audio.frame import encode_frame, decode_frames, join_frames
+from client.udp_media import UdpMediaClient
+from utils.latency import ENQUEUE_TO_EMIT
+from utils.thread_utils import set_high_priority
+
+# Backend asyncio del cliente.
+#
+# Alternativa a run_client_process: un socketio.AsyncClient corriendo en un
+# único event loop dentro del proceso principal, sin proceso hijo ni hilos
+# de envío/recepción. El event loop vive en su propio hilo porque el hilo
+# principal es de Qt. El audio capturado se deja en un ring acotado
+# (thread-safe) y el loop lo vacía cuando se le avisa; el audio recibido se
+# entrega directamente a los buffers de jitter del MicrophoneListener.
+
+
+class AsyncSocketIOClient:
+    """Conexión Socket.IO en un event loop asyncio del proceso principal"""
+
+    def __init__(self, client, max_pending=64, max_batch=8):
+        self.client = client
+        # Ring de envío: si el loop se atrasa se descartan los más antiguos, y
+        # lo que pase de `client.send_deadline` no se envía
+        self._send_ring = deque(maxlen=max_pending)
+        self.max_batch = max_batch
+        self._room_codec = get_codec(DEFAULT_CODEC)
+        self._loop = None
+        self._sio = None
+        self._wake = None
+        self._thread = None
+        self._stopping = False
+        # Voz por UDP si el servidor la ofrece; se recibe en el hilo del socket
+        self._media = UdpMediaClient(on_voice=self._play_voice) if client.udp else None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=False)
+        self._thread.start()
+
+    def _run(self):
+        set_high_priority()
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._sio = socketio.AsyncClient(
+            reconnection=True, reconnection_attempts=0, reconnection_delay=1,
+            handle_sigint=False,
+        )
+        self._register_handlers()
+
+        sender = asyncio.create_task(self._sender())
+        try:
+            while not self._stopping:
+                try:
+                    print(f"Intentando conectar a {self.client.url} usando websocket...")
+                    await self._sio.connect(self.client.url, transports=['websocket'])
+                    print("Conexión websocket exitosa!")
+                    await self._sio.wait()
+                except Exception as e:
+                    print(f"Fallo la conexión websocket: {e}")
+                    print("Intentando fallback a polling...")
+                    try:
+                        await self._sio.connect(self.client.url, transports=['polling'])
+                        print("Conexión polling exitosa!")
+                        await self._sio.wait()
+                    except Exception as e2:
+                        print(f"Fallo la conexión polling: {e2}")
+                if not self._stopping:
+                    await asyncio.sleep(1)
+        finally:
+            sender.cancel()
+            if self._sio.connected:
+                await self._sio.disconnect()
+
+    def _register_handlers(self):
+        sio = self._sio
+        client = self.client
+
+        @sio.event
+        async def connect():
+            print("Connection established with Socket.IO server!")
+            await sio.emit("new_user", {
+                "name": client.name,
+                "room_code": client.room_code,
+                "codecs": list(client.codecs),
+                "user_id": client.user_id,
+            })
+
+        @sio.event
+        async def disconnect():
+            print("Disconnected from Socket.IO server.")
+            if self._media is not None:
+                self._media.stop()
+
+        @sio.event
+        async def connect_error(data):
+            print(f"The connection failed! Data: {data}")
+
+        @sio.on("voice")
+        async def on_voice_data(sender, data, relay_time=0.0):
+            self._play_voice(sender, data, relay_time)
+
+        @sio.on("media")
+        async def on_media(info):
+            if self._media is not None:
+                print(f"Voz por UDP en el puerto {info['port']}")
+                self._media.start(urlparse(client.url).hostname or "localhost", info["port"], info["token"])
+
+        @sio.on("chat_message")
+        async def on_chat_message(msg, msg_id=None):
+            client._chat_message(msg, msg_id)
+
+        @sio.on("chat_backlog")
+        async def on_chat_backlog(messages):
+            client._chat_backlog(messages)
+
+        @sio.on("roster")
+        async def on_roster(users):
+            client._set_roster(users)
+
+        @sio.on("user_joined")
+        async def on_user_joined(user):
+            client._update_user({"id": user["id"], "name": user["name"], "join": True})
+
+        @sio.on("user_left")
+        async def on_user_left(user):
+            client._update_user({"id": user["id"], "join": False})
+
+        @sio.on("codec")
+        async def on_codec(codec_name):
+            try:
+                self._room_codec = get_codec(codec_name)
+                print(f"Códec de la sala: {codec_name}")
+            except KeyError:
+                print(f"Códec no soportado anunciado por el servidor: {codec_name}")
+
+    def _play_voice(self, sender, data, relay_time=0.0):
+        client = self.client
+        if isinstance(data, (bytes, bytearray)) and client.callback_play_sound:
+            for arr, header in decode_frames(data):
+                client.callback_play_sound(
+                    arr, sender, client._trace_received(header, relay_time), header.samplerate
+                )
+
+    @property
+    def udp_active(self):
+        return self._media is not None and self._media.ready
+
+    @property
+    def udp_lost(self):
+        return self._media.lost if self._media is not None else 0
+
+    async def _sender(self):
+        """Vaciar el ring de envío cada vez que el hilo de audio avisa"""
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._send_ring:
+                # Con atraso se juntan varias tramas en un solo paquete
+                batch = []
+                enqueued_at = []
+                while self._send_ring and len(batch) < self.max_batch:
+                    block, samplerate, seq, captured, enqueued = self._send_ring.popleft()
+                    if not self._sio.connected or time.monotonic() - enqueued > self.client.send_deadline:
+                        self.client.stale_dropped += 1
+                        continue
+                    batch.append(encode_frame(block, samplerate, self._room_codec, seq, captured))
+                    enqueued_at.append(enqueued)
+                if not batch:
+                    continue
+                try:
+                    if self.udp_active:
+                        # Por UDP cada trama va en su propio datagrama; las que
+                        # no se pudieron mandar siguen por Socket.IO
+                        batch = [frame for frame in batch if not self._media.send(frame)]
+                    if batch:
+                        await self._sio.emit("voice", join_frames(batch))
+                    now = time.monotonic()
+                    for enqueued in enqueued_at:
+                        self.client.latency.record(ENQUEUE_TO_EMIT, now - enqueued)
+                except Exception as e:
+                    print(f"Error en sender: {e}")
+
+    def send_audio(self, block, samplerate, seq=0, captured=0.0):
+        """Llamado desde el callback de audio (otro hilo)"""
+        if self._loop is None:
+            return
+        self._send_ring.append((block, samplerate, seq, captured, time.monotonic()))
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def send_chat(self, msg):
+        """Llamado desde el hilo de Qt"""
+        if self._loop is None or not self._sio.connected:
+            return
+        asyncio.run_coroutine_threadsafe(self._sio.emit("chat_message", msg), self._loop)
+
+    def stop(self):
+        self._stopping = True
+        if self._media is not None:
+            self._media.stop()
+        if self._loop is not None and self._sio is not None:
+            asyncio.run_coroutine_threadsafe(self._sio.disconnect(), self._loop)
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1.0)
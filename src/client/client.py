@@ -1,25 +1,65 @@
 from time import sleep
+import time
+import uuid
+import struct
 from PySide6.QtCore import Signal
 import socketio
 import multiprocessing
 import numpy as np
 import threading
-from queue import Empty
+from collections import deque
+from urllib.parse import urlparse
+from audio.codec import CODEC_PREFERENCE, DEFAULT_CODEC, get_codec
+from audio.frame import encode_frame, decode_frames, join_frames
+from utils.channel import Channel, AUDIO, STOP
+from client.async_client import AsyncSocketIOClient
+from client.udp_media import UdpMediaClient
+from utils.latency import (
+    LatencyTracker,
+    CAPTURE_TO_ENQUEUE,
+    ENQUEUE_TO_EMIT,
+    CAPTURE_TO_RELAY,
+    RELAY_TO_ARRIVAL,
+    ARRIVAL_TO_DEQUEUE,
+)
 from utils.thread_utils import (
     set_high_priority,
     create_high_priority_thread,
 )
 
+# Backends disponibles para la conexión Socket.IO
+BACKEND_PROCESS = "process"  # socketio.Client síncrono en un proceso hijo
+BACKEND_ASYNCIO = "asyncio"  # socketio.AsyncClient en el proceso principal
+
+# Metadatos de cada bloque capturado en el canal de envío: samplerate,
+# canales, secuencia, hora de captura (pared) y de encolado (monótona)
+_BLOCK_TAG = struct.Struct("<IIIdd")
+# Metadatos de cada paquete recibido: hora del relay (pared) y de llegada al
+# proceso hijo (monótona), seguidos del id del emisor
+_VOICE_TAG = struct.Struct("<dd")
+# Cada cuánto manda el proceso hijo sus muestras de latencia
+TRACE_FLUSH_INTERVAL = 1.0
+# Antigüedad máxima (s) de un bloque en la cola de envío: los más viejos se
+# descartan en lugar de mandarse tarde. Con esto la cola queda acotada por
+# tiempo, y tras una reconexión no se repite voz vieja a la sala.
+SEND_DEADLINE = 0.2
+# Tramas que se juntan como mucho en un paquete cuando hay atraso
+MAX_BATCH_FRAMES = 8
+# Ids de chat recordados para no repetir mensajes al reconectar; alcanza con
+# que supere el historial que manda el servidor (--chat-history)
+CHAT_SEEN_LIMIT = 1000
+
 # Función de nivel superior para el proceso hijo
 def run_client_process(
     url,
     room_code,
-    send_queue,
-    receive_queue,
-    chat_send_queue,
-    chat_receive_queue,
-    users_receive_queue,
+    outgoing,
+    incoming,
     name,
+    codecs=None,
+    user_id=None,
+    send_deadline=SEND_DEADLINE,
+    udp=True,
 ):
 
     """Función ejecutada en el proceso hijo con alta prioridad"""
@@ -30,95 +70,172 @@ def run_client_process(
         reconnection=True, reconnection_attempts=0, reconnection_delay=1
     )
 
+    codecs = list(codecs or CODEC_PREFERENCE)
+    # Códec negociado para la sala; se actualiza con el evento 'codec'
+    room_codec = {"codec": get_codec(DEFAULT_CODEC)}
+
     # Definimos los callbacks internos
     def on_connect():
         print("Connection established with Socket.IO server!")
 
         sleep(5)
-        sio.emit("new_user", {"name": name, "room_code": room_code})
+        sio.emit("new_user", {
+            "name": name,
+            "room_code": room_code,
+            "codecs": codecs,
+            "user_id": user_id,
+        })
 
     def on_disconnect():
         print("Disconnected from Socket.IO server.")
+        if media is not None:
+            # El token muere con la conexión; al volver a entrar llega otro
+            media.stop()
 
     def on_connect_error(data):
         print(f"The connection failed! Data: {data}")
 
-    def on_voice_data(data):
-        if isinstance(data, list):
-            receive_queue.put(data)
+    # La voz llega del hilo de Socket.IO y del de UDP, pero el ring de entrada
+    # admite un solo productor (ver utils/channel.py)
+    voice_lock = threading.Lock()
+
+    def on_voice_data(sender, data, relay_time=0.0):
+        # El servidor etiqueta cada paquete con su emisor y la hora del relay
+        if isinstance(data, (bytes, bytearray)):
+            tag = _VOICE_TAG.pack(relay_time or 0.0, time.monotonic()) + sender.encode()
+            with voice_lock:
+                incoming.put_audio(data, tag)
+
+    def on_chat_message(msg, msg_id=None):
+        incoming.put("chat", (msg, msg_id))
+
+    def on_chat_backlog(messages):
+        incoming.put("chat_backlog", messages)
+
+    def on_roster(users):
+        incoming.put("roster", users)
+
+    def on_user_joined(user):
+        incoming.put("user", {"id": user["id"], "name": user["name"], "join": True})
 
-    def on_chat_message(msg):
-        chat_receive_queue.put(msg)
+    def on_user_left(user):
+        incoming.put("user", {"id": user["id"], "join": False})
 
-    def on_new_user(name):
-        users_receive_queue.put({"name": name, "join": True})
+    def on_codec(codec_name):
+        try:
+            room_codec["codec"] = get_codec(codec_name)
+            print(f"Códec de la sala: {codec_name}")
+        except KeyError:
+            print(f"Códec no soportado anunciado por el servidor: {codec_name}")
+
+    # Voz por UDP si el servidor la ofrece (ver client/udp_media.py); los
+    # paquetes que llegan por ahí siguen el mismo camino que los de Socket.IO
+    def on_media_state(ready):
+        incoming.put("udp", {"active": ready, "lost": media.lost})
 
-    def on_disconnect_user(name):
-        users_receive_queue.put({"name": name, "join": False})
+    media = UdpMediaClient(on_voice=on_voice_data, on_state=on_media_state) if udp else None
+
+    def on_media(info):
+        if media is not None:
+            print(f"Voz por UDP en el puerto {info['port']}")
+            media.start(urlparse(url).hostname or "localhost", info["port"], info["token"])
 
     # Asignamos los callbacks
     sio.on("connect", on_connect)
     sio.on("disconnect", on_disconnect)
     sio.on("connect_error", on_connect_error)
     sio.on("voice", on_voice_data)
-    sio.on("new_user", on_new_user)
-    sio.on("disconnect_user", on_disconnect_user)
+    sio.on("roster", on_roster)
+    sio.on("user_joined", on_user_joined)
+    sio.on("user_left", on_user_left)
     sio.on("chat_message", on_chat_message)
+    sio.on("chat_backlog", on_chat_backlog)
+    sio.on("codec", on_codec)
+    sio.on("media", on_media)
 
     # Evento para controlar el hilo de envío
     stop_event = threading.Event()
+    # Muestras de latencia de este proceso; se mandan al principal cada segundo
+    tracker = LatencyTracker()
+    last_flush = [time.monotonic()]
+
+    stale = [0]
+
+    def emit_batch(batch, enqueued):
+        if media is not None and media.ready:
+            # Por UDP cada trama va en su propio datagrama; las que no se
+            # pudieron mandar siguen por Socket.IO
+            batch = [frame for frame in batch if not media.send(frame)]
+        if batch:
+            # Se envía como adjunto binario (cabecera + audio codificado por trama)
+            sio.emit("voice", join_frames(batch))
+        now = time.monotonic()
+        for t in enqueued:
+            tracker.record_pending(ENQUEUE_TO_EMIT, now - t)
+
+    def send_audio():
+        """Vaciar la cola de envío; si hay atraso, varias tramas por paquete"""
+        batch = []
+        enqueued_at = []
+        for tag, payload in outgoing.drain_audio():
+            samplerate, channels, seq, captured, enqueued = _BLOCK_TAG.unpack(tag)
+            if not sio.connected or time.monotonic() - enqueued > send_deadline:
+                stale[0] += 1
+                continue
+            block = np.frombuffer(payload, dtype=np.float32).reshape(-1, channels)
+            batch.append(encode_frame(block, samplerate, room_codec["codec"], seq, captured))
+            enqueued_at.append(enqueued)
+            if len(batch) >= MAX_BATCH_FRAMES:
+                emit_batch(batch, enqueued_at)
+                batch, enqueued_at = [], []
+        if batch:
+            emit_batch(batch, enqueued_at)
+
+        now = time.monotonic()
+        if now - last_flush[0] >= TRACE_FLUSH_INTERVAL:
+            last_flush[0] = now
+            incoming.put("trace", tracker.drain())
+            if stale[0]:
+                incoming.put("stale", stale[0])
+                stale[0] = 0
+            if media is not None:
+                incoming.put("udp", {"active": media.ready, "lost": media.lost})
 
     def sender_thread():
-        """Hilo que envía datos desde la cola con alta prioridad"""
+        """Hilo único de envío: audio y chat llegan por el mismo canal"""
         # Configurar alta prioridad para el hilo de envío
         set_high_priority()
 
         while not stop_event.is_set():
             try:
-                # Intentar obtener datos de la cola con timeout corto
-                package = send_queue.get(
-                    timeout=0.01
-                )  # 10ms timeout para menor latencia
-                if sio.connected:
-                    # Accedemos directamente a los datos sin subniveles adicionales
-                    data_to_send = package["data"]["data"]
-                    if isinstance(data_to_send, np.ndarray):
-                        data_to_send = data_to_send.tolist()
-                    sio.emit("voice", data_to_send)
-            except Empty:
-                pass
+                # Bloquea hasta el próximo mensaje, sin sondeo
+                kind, payload = outgoing.recv()
+                if kind == STOP:
+                    break
+                elif kind == AUDIO:
+                    send_audio()
+                elif kind == "chat" and sio.connected:
+                    sio.emit("chat_message", payload)
+            except (EOFError, OSError):
+                # El proceso principal cerró el canal
+                break
             except Exception as e:
                 print(f"Error en sender_thread: {e}")
 
-    def chat_sender_thread():
-        """Hilo que envía mensajes de chat desde la cola con alta prioridad"""
-        set_high_priority()
-        while not stop_event.is_set():
-            try:
-                msg = chat_send_queue.get(
-                    timeout=0.05
-                )  # 50ms timeout para mensajes de chat
-                if sio.connected:
-                    sio.emit("chat_message", msg)
-            except Empty:
-                pass
-            except Exception as e:
-                print(f"Error en chat_sender_thread: {e}")
-
     def disconnect():
         print("Disconnected")
 
         stop_event.set()
+        outgoing.stop()
         sender.join(timeout=1.0)
-        chat_sender.join(timeout=1.0)
+        if media is not None:
+            media.stop()
         if sio.connected:
             sio.disconnect()
 
     # Iniciar hilo de envío
     sender = threading.Thread(target=sender_thread, daemon=False)
-    chat_sender = threading.Thread(target=chat_sender_thread, daemon=False)
     sender.start()
-    chat_sender.start()
 
     # Bucle de conexión/reconexión
     while not stop_event.is_set():
@@ -149,48 +266,78 @@ class Client:
         callback_chat_message=None,
         callback_users_online=None,
         callback_remove_user=None,
+        callback_roster=None,
         name=None,
         room_code=None,
+        codecs=None,
+        backend=BACKEND_PROCESS,
+        send_deadline=SEND_DEADLINE,
+        udp=True,
     ):
+        if backend not in (BACKEND_PROCESS, BACKEND_ASYNCIO):
+            raise ValueError(f"Backend desconocido: {backend}")
         self.url = url
+        self.backend = backend
         self.room_code = room_code
         self.callback_play_sound = callback_play_sound
         self.callback_chat_message = callback_chat_message
         self.callback_users_online = callback_users_online
         self.callback_remove_user = callback_remove_user
+        self.callback_roster = callback_roster
         self.connected = False
+        self.send_deadline = send_deadline
+        # Bloques descartados por viejos antes de enviarse
+        self.stale_dropped = 0
+        # Voz por UDP cuando el servidor la ofrece (ver client/udp_media.py)
+        self.udp = udp
+        self.udp_active = False
+        self.udp_lost = 0
         self._process = None
-        # Cola para enviar datos al proceso hijo
-        self.send_queue = multiprocessing.Queue(
-            maxsize=1000
-        )  # Limitar tamaño para evitar memoria excesiva
-        # Cola para recibir datos del proceso hijo
-        self.receive_queue = multiprocessing.Queue(maxsize=1000)
-        self.chat_send_queue = multiprocessing.Queue(maxsize=100)
-        self.chat_receive_queue = multiprocessing.Queue(maxsize=100)
-        self.users_receive_queue = multiprocessing.Queue(maxsize=100)
+        self._async_client = None
+        self.outgoing = None
+        self.incoming = None
+        if backend == BACKEND_PROCESS:
+            # Un canal por dirección: audio por memoria compartida y chat/usuarios
+            # por el mismo Pipe, con un único hilo consumidor en cada extremo
+            self.outgoing = Channel(slots=64, slot_size=32768)
+            self.incoming = Channel(slots=128, slot_size=65536)
+        else:
+            self._async_client = AsyncSocketIOClient(self)
 
         # Evento para detener el hilo de recepción
         self.stop_event = threading.Event()
         # Hilo para recibir datos
         self.receive_thread = None
-        self.chat_receive_thread = None
         self.name = name
+        # Códecs aceptados en orden de preferencia (ver audio/codec.py)
+        self.codecs = codecs or CODEC_PREFERENCE
+        # Id estable del usuario: se conserva entre reconexiones
+        self.user_id = uuid.uuid4().hex
+        # Ids de los últimos mensajes de chat mostrados (ver _chat_message)
+        self._seen_chat = deque(maxlen=CHAT_SEEN_LIMIT)
+        self._seen_chat_ids = set()
+        # Latencia por tramos del camino de voz (ver latency_stats)
+        self.latency = LatencyTracker()
 
     def run_socketio_client(self):
         """Inicia el cliente Socket.IO en un proceso separado con alta prioridad"""
+        if self.backend == BACKEND_ASYNCIO:
+            self._async_client.start()
+            return
+
         if self._process is None or not self._process.is_alive():
             self._process = multiprocessing.Process(
                 target=run_client_process,
                 args=(
                     self.url,
                     self.room_code,
-                    self.send_queue,
-                    self.receive_queue,
-                    self.chat_send_queue,
-                    self.chat_receive_queue,
-                    self.users_receive_queue,
-                    self.name
+                    self.outgoing,
+                    self.incoming,
+                    self.name,
+                    self.codecs,
+                    self.user_id,
+                    self.send_deadline,
+                    self.udp,
                 ),
                 daemon=False,  # Evitar que se termine al minimizar
             )
@@ -200,99 +347,153 @@ class Client:
             self.stop_event.clear()
             self.receive_thread = create_high_priority_thread(target=self._receive_loop)
             self.receive_thread.start()
-            self.chat_receive_thread = create_high_priority_thread(
-                target=self._chat_receive_loop
-            )
-            self.chat_receive_thread.start()
-            self.online_users_thread = create_high_priority_thread(
-                target=self._receive_name_loop
-            )
-            self.online_users_thread.start()
 
     def _receive_loop(self):
-        """Bucle para recibir datos en el proceso principal con alta prioridad"""
+        """Bucle único de recepción: audio, chat y usuarios por el mismo canal"""
         # Configurar alta prioridad para el hilo de recepción
         set_high_priority()
 
         while not self.stop_event.is_set():
             try:
-                # Bloquear hasta que haya datos disponibles con timeout corto
-                data_list = self.receive_queue.get(
-                    timeout=0.01
-                )  # 10ms timeout para menor latencia
-                if self.callback_play_sound:
-                    arr = np.array(data_list, dtype=np.float32)
-                    self.callback_play_sound(arr)
-            except Empty:
-                pass
+                # Bloquea hasta el próximo mensaje del proceso hijo, sin sondeo
+                kind, payload = self.incoming.recv()
+                if kind == STOP:
+                    break
+                elif kind == AUDIO:
+                    self._play_received_audio()
+                elif kind == "chat":
+                    self._chat_message(*payload)
+                elif kind == "chat_backlog":
+                    self._chat_backlog(payload)
+                elif kind == "user":
+                    self._update_user(payload)
+                elif kind == "roster":
+                    self._set_roster(payload)
+                elif kind == "trace":
+                    self.latency.merge(payload)
+                elif kind == "stale":
+                    self.stale_dropped += payload
+                elif kind == "udp":
+                    self.udp_active = payload["active"]
+                    self.udp_lost = payload["lost"]
+            except (EOFError, OSError):
+                break
             except Exception as e:
                 print(f"Error en receive_loop: {e}")
 
-    def _receive_name_loop(self):
-        set_high_priority()
-
-        while not self.stop_event.is_set():
-            try:
-                user = self.users_receive_queue.get(timeout=0.05)
-                if self.callback_users_online and self.callback_remove_user:
-                    if user["join"]:
-                        self.callback_users_online(user["name"])
-                    else:
-                        self.callback_remove_user(user["name"])
-            except Empty:
-                pass
-            except Exception as e:
-                print(f"Error en chat_receive_loop: {e}")
-
-    def _chat_receive_loop(self):
-        """Bucle para recibir mensajes de chat en el proceso principal con alta prioridad"""
-        set_high_priority()
-        while not self.stop_event.is_set():
-            try:
-                msg = self.chat_receive_queue.get(
-                    timeout=0.05
-                )  # 50ms timeout para mensajes de chat
-                if self.callback_chat_message:
-                    self.callback_chat_message(msg)
-            except Empty:
-                pass
-            except Exception as e:
-                print(f"Error en chat_receive_loop: {e}")
+    def _play_received_audio(self):
+        for tag, payload in self.incoming.drain_audio():
+            relay_time, arrival = _VOICE_TAG.unpack_from(tag)
+            sender = tag[_VOICE_TAG.size:].decode()
+            now = time.monotonic()
+            self.latency.record(ARRIVAL_TO_DEQUEUE, now - arrival)
+            if self.callback_play_sound:
+                # Un paquete puede traer varias tramas si el emisor se atrasó
+                for arr, header in decode_frames(payload):
+                    trace = self._trace_received(header, relay_time, now - arrival)
+                    self.callback_play_sound(arr, sender, trace, header.samplerate)
+
+    def _trace_received(self, header, relay_time, since_arrival=0.0):
+        """Registrar los tramos hasta la recepción y armar la traza del bloque"""
+        if relay_time:
+            arrival_wall = time.time() - since_arrival
+            self.latency.record(RELAY_TO_ARRIVAL, arrival_wall - relay_time)
+            if header.timestamp:
+                self.latency.record(CAPTURE_TO_RELAY, relay_time - header.timestamp)
+        return {"dequeued": time.monotonic(), "captured": header.timestamp, "seq": header.seq}
+
+    @property
+    def voice_transport(self):
+        """Por dónde viaja la voz ahora ("UDP" o "Socket.IO")"""
+        if self.backend == BACKEND_ASYNCIO:
+            active = self._async_client.udp_active
+        else:
+            active = self.udp_active
+        return "UDP" if active else "Socket.IO"
+
+    def latency_stats(self):
+        """Percentiles (ms) de la ventana actual para cada tramo"""
+        return self.latency.percentiles()
+
+    def _chat_message(self, msg, msg_id=None):
+        """Mostrar un mensaje de chat salvo que ya se haya mostrado"""
+        if msg_id is not None:
+            if msg_id in self._seen_chat_ids:
+                return
+            if len(self._seen_chat) == self._seen_chat.maxlen:
+                self._seen_chat_ids.discard(self._seen_chat[0])
+            self._seen_chat.append(msg_id)
+            self._seen_chat_ids.add(msg_id)
+        if self.callback_chat_message:
+            self.callback_chat_message(msg)
+
+    def _chat_backlog(self, messages):
+        """Chat reciente de la sala, recibido en un solo evento al entrar
+
+        Llega de nuevo en cada reconexión: los mensajes ya mostrados se saltean.
+        """
+        for msg_id, msg in messages:
+            self._chat_message(msg, msg_id)
+
+    def _update_user(self, user):
+        """Aplicar un delta de la lista de usuarios (alta o baja por id)"""
+        if self.callback_users_online and self.callback_remove_user:
+            if user["join"]:
+                self.callback_users_online(user["id"], user["name"])
+            else:
+                self.callback_remove_user(user["id"])
+
+    def _set_roster(self, users):
+        """Lista completa de la sala, recibida una sola vez al entrar"""
+        if self.callback_roster:
+            self.callback_roster(users)
 
     def stop(self):
         """Detiene el cliente y los hilos asociados"""
         self.stop_event.set()
+        if self.backend == BACKEND_ASYNCIO:
+            self._async_client.stop()
+            return
+
         if self.receive_thread and self.receive_thread.is_alive():
+            # Despertar al hilo de recepción, que está bloqueado en recv()
+            self.incoming.stop()
             self.receive_thread.join(timeout=1.0)
-        if self.chat_receive_thread and self.chat_receive_thread.is_alive():
-            self.chat_receive_thread.join(timeout=1.0)
         if self._process and self._process.is_alive():
             self._process.terminate()
             self._process.join()
+        self.outgoing.close()
+        self.incoming.close()
 
     def send_package(self, data):
-        """Envía datos de audio al proceso de Socket.IO mediante la cola"""
+        """Envía datos de audio al proceso de Socket.IO por memoria compartida"""
         try:
-            # Si la cola está llena, eliminar el elemento más antiguo
-            if self.send_queue.full():
-                try:
-                    self.send_queue.get_nowait()
-                except Empty:
-                    pass
-
-            # Mantenemos los datos como están (se convertirán en el proceso hijo)
-            self.send_queue.put({"data": data}, block=False)
+            # El ring copia el bloque a su slot; si el hijo se atrasa se pierden
+            # los más antiguos. La codificación se hace en el proceso hijo.
+            captured = data.get("captured", 0.0)
+            if captured:
+                self.latency.record(CAPTURE_TO_ENQUEUE, time.time() - captured)
+            if self.backend == BACKEND_ASYNCIO:
+                # El bloque de sounddevice se reutiliza: hay que copiarlo
+                self._async_client.send_audio(
+                    np.array(data["data"], dtype=np.float32), data["samplerate"],
+                    data.get("seq", 0), captured,
+                )
+                return
+            block = np.ascontiguousarray(data["data"], dtype=np.float32)
+            tag = _BLOCK_TAG.pack(
+                data["samplerate"], block.shape[1], data.get("seq", 0), captured, time.monotonic()
+            )
+            self.outgoing.put_audio(block, tag)
         except Exception as e:
             print(f"Error en send_package: {e}")
 
     def send_chat_message(self, msg):
-        """Envía mensajes de chat al proceso de Socket.IO mediante la cola"""
+        """Envía mensajes de chat al proceso de Socket.IO por el canal de salida"""
         try:
-            if self.chat_send_queue.full():
-                try:
-                    self.chat_send_queue.get_nowait()
-                except Empty:
-                    pass
-            self.chat_send_queue.put(f"{self.name}: {msg}", block=False)
+            if self.backend == BACKEND_ASYNCIO:
+                self._async_client.send_chat(f"{self.name}: {msg}")
+                return
+            self.outgoing.put("chat", f"{self.name}: {msg}")
         except Exception as e:
             print(f"Error en send_chat_message: {e}")
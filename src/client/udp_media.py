@@ -0,0 +1,136 @@
+import time
+import socket
+import threading
+from utils.datagram import (
+    HELLO,
+    MAX_DATAGRAM,
+    VOICE,
+    DatagramError,
+    pack_datagram,
+    seq_advance,
+    unpack_datagram,
+)
+from utils.thread_utils import set_high_priority
+
+# Voz por UDP del lado del cliente (ver utils/datagram.py).
+#
+# El servidor anuncia puerto y token por Socket.IO. Desde ahí se manda HELLO
+# hasta que el servidor contesta; mientras haya respuesta la voz se envía y
+# se recibe por UDP, y si deja de haberla se vuelve a Socket.IO sin cortar la
+# conexión. Un hilo propio recibe los datagramas y manda los HELLO de
+# mantenimiento que sostienen la asociación del NAT.
+
+
+class UdpMediaClient:
+    """Socket UDP con el relay del servidor"""
+
+    # Reintentos de HELLO mientras el servidor no contesta
+    HELLO_INTERVAL = 0.5
+    # HELLO periódico una vez establecido (mantiene abierto el NAT)
+    KEEPALIVE_INTERVAL = 2.0
+    # Sin noticias del servidor por más de esto, la voz vuelve a Socket.IO
+    SERVER_TIMEOUT = 6.0
+
+    def __init__(self, on_voice, on_state=None):
+        self.on_voice = on_voice  # on_voice(emisor, paquete, hora del relay)
+        self.on_state = on_state  # on_state(ready), cuando cambia `ready`
+        self._was_ready = False
+        self._sock = None
+        self._addr = None
+        self._token = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._seq = 0
+        self._in_seq = None
+        self._last_heard = 0.0
+        self._last_hello = 0.0
+        self.lost = 0  # Datagramas del servidor que no llegaron
+
+    @property
+    def ready(self):
+        """¿Contestó el servidor hace poco? Solo entonces se usa UDP"""
+        return self._addr is not None and time.monotonic() - self._last_heard < self.SERVER_TIMEOUT
+
+    def start(self, host, port, token):
+        """Presentarse al relay con el token (hex) recibido por Socket.IO"""
+        self.stop()
+        self._addr = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+        self._token = bytes.fromhex(token)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.settimeout(self.HELLO_INTERVAL)
+        self._in_seq = None
+        self._last_heard = 0.0
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self._thread.start()
+
+    def _hello(self, sock, addr):
+        self._last_hello = time.monotonic()
+        try:
+            sock.sendto(pack_datagram(HELLO, self._token), addr)
+        except OSError:
+            pass
+
+    def _receive_loop(self):
+        set_high_priority()
+        sock, server = self._sock, self._addr
+        self._hello(sock, server)
+        while not self._stop_event.is_set():
+            try:
+                data, addr = sock.recvfrom(MAX_DATAGRAM)
+                if addr == server:
+                    self._handle(data)
+            except socket.timeout:
+                pass
+            except OSError:
+                # Socket cerrado por stop(), o ICMP de puerto inalcanzable
+                if self._stop_event.is_set():
+                    break
+            ready = self.ready
+            if ready != self._was_ready:
+                self._was_ready = ready
+                if self.on_state:
+                    self.on_state(ready)
+            interval = self.KEEPALIVE_INTERVAL if ready else self.HELLO_INTERVAL
+            if time.monotonic() - self._last_hello >= interval:
+                self._hello(sock, server)
+
+    def _handle(self, data):
+        try:
+            datagram = unpack_datagram(data)
+        except DatagramError:
+            return
+        if datagram.kind == HELLO:
+            if datagram.token == self._token:
+                self._last_heard = time.monotonic()
+            return
+        self._last_heard = time.monotonic()
+        self._in_seq, lost = seq_advance(self._in_seq, datagram.seq)
+        self.lost += lost
+        self.on_voice(datagram.sender.decode(), bytes(datagram.payload), datagram.relay_time)
+
+    def send(self, frame):
+        """Mandar una trama; False si UDP no está disponible"""
+        sock, addr = self._sock, self._addr
+        if sock is None or not self.ready:
+            return False
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        try:
+            sock.sendto(pack_datagram(VOICE, self._token, self._seq, payload=frame), addr)
+        except (OSError, DatagramError):
+            return False
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        self._addr = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        if self._was_ready:
+            self._was_ready = False
+            if self.on_state:
+                self.on_state(False)
@@ -0,0 +1,106 @@
+import time
+import asyncio
+
+# Backend asyncio del servidor.
+#
+# server.py define los handlers una sola vez, en estilo síncrono, contra la
+# API de socketio.Server (emit, enter_room, leave_room, manager...). Con
+# `--backend asyncio` esos mismos handlers se registran en un
+# socketio.AsyncServer y `sio` pasa a ser un AsyncServerFacade: los emits
+# arrancan como tareas en el acto (así un emit hecho antes de enter_room no
+# llega a quien entra, igual que con eventlet) y las salas se manejan con
+# las mismas operaciones del client manager. El facade guarda las tareas
+# pendientes, porque el event loop solo las referencia débilmente y un emit
+# a medio enviar podría recolectarse. Los bucles de fondo se escriben
+# como generadores que ceden los segundos a dormir (ver `drive_loop`), así
+# sirven para los dos backends.
+
+
+class AsyncServerFacade:
+	"""API síncrona de socketio.Server sobre un socketio.AsyncServer"""
+
+	def __init__(self, server):
+		self.server = server
+		self._tasks = set()  # Emits en curso
+
+	@property
+	def manager(self):
+		return self.server.manager
+
+	def on(self, event, handler=None, namespace=None):
+		return self.server.on(event, handler, namespace=namespace)
+
+	def emit(self, event, data=None, to=None, room=None, skip_sid=None, namespace=None, on_done=None):
+		"""Emitir en una tarea; `on_done(segundos)` recibe cuánto tardó el emit"""
+		# Tarea que corre ya hasta su primera espera: los destinatarios se
+		# resuelven en este momento y los emits no se desordenan
+		task = asyncio.eager_task_factory(
+			asyncio.get_running_loop(),
+			self._emit(on_done, event, data, to=to, room=room, skip_sid=skip_sid, namespace=namespace),
+		)
+		if not task.done():
+			self._tasks.add(task)
+			task.add_done_callback(self._tasks.discard)
+		return task
+
+	async def _emit(self, on_done, *args, **kwargs):
+		start = time.perf_counter()
+		await self.server.emit(*args, **kwargs)
+		if on_done is not None:
+			on_done(time.perf_counter() - start)
+
+	def enter_room(self, sid, room, namespace=None):
+		self.server.manager.basic_enter_room(sid, namespace or "/", room)
+
+	def leave_room(self, sid, room, namespace=None):
+		self.server.manager.basic_leave_room(sid, namespace or "/", room)
+
+	def start_background_task(self, target, *args, **kwargs):
+		"""`target` puede ser una corrutina o un bucle generador (ver drive_loop)"""
+		result = target(*args, **kwargs)
+		if asyncio.iscoroutine(result):
+			return asyncio.ensure_future(result)
+		return asyncio.ensure_future(drive_loop(result))
+
+
+async def drive_loop(loop):
+	"""Correr un bucle generador que cede cuántos segundos dormir"""
+	for delay in loop:
+		await asyncio.sleep(delay)
+
+
+class _MediaProtocol(asyncio.DatagramProtocol):
+	def __init__(self, relay):
+		self.relay = relay
+
+	def datagram_received(self, data, addr):
+		try:
+			self.relay.handle_datagram(data, addr)
+		except Exception as e:
+			print(f"Error en el relay UDP: {e}")
+
+	def error_received(self, exc):
+		# P. ej. ICMP de un puerto cerrado del lado del cliente
+		pass
+
+
+async def open_media_endpoint(relay, host, port):
+	"""Atender el UdpRelay con un endpoint de datagramas del event loop
+
+	El transporte tiene el mismo sendto/close que un socket, así que el
+	relay lo usa como tal.
+	"""
+	transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+		lambda: _MediaProtocol(relay), local_addr=(host, port),
+	)
+	relay.sock = transport
+	return transport
+
+
+def run(app, host, port):
+	"""Servir la app ASGI con uvicorn"""
+	try:
+		import uvicorn
+	except ImportError:
+		raise SystemExit("El backend asyncio necesita uvicorn: pip install uvicorn")
+	uvicorn.run(app, host=host, port=port, log_level="warning", access_log=False)
@@ -0,0 +1,279 @@
+import json
+import base64
+import socket
+import struct
+import threading
+import socketserver
+import socketio
+from relay.store import RoomStore
+from relay.outbound import VoiceQueueManager
+
+# Broker local para correr el servidor con varios workers.
+#
+# Hace de backend pub/sub para el client manager de Socket.IO (cada emit a
+# una sala se reparte a todos los workers) y además aloja el RoomStore
+# compartido. No necesita servicios externos: escucha en un socket UNIX
+# ("unix:/ruta") o en TCP ("host:puerto") y habla mensajes JSON con un
+# prefijo de longitud de 4 bytes.
+#
+#   {"op": "subscribe", "channel": ...}         -> recibe cada publish
+#   {"op": "publish", "channel": ..., "data": ...}
+#   {"op": "call", "method": ..., "args": [...]} -> {"result": ...} / {"error": ...}
+#
+# Los emits de voz llevan (id, bytes, hora): los bytes viajan en base64 como
+# {"$bytes": ...} y las tuplas como {"$tuple": [...]}, porque Socket.IO toma
+# una tupla como varios argumentos y una lista como uno solo.
+#
+# Si se cae la conexión de un worker, el broker saca del store a los sids que
+# ese worker había hecho entrar y avisa a sus salas, así no quedan miembros
+# fantasma.
+
+_LENGTH = struct.Struct("!I")
+_BYTES = "$bytes"
+_TUPLE = "$tuple"
+
+
+def _pack(value):
+	"""Llevar bytes y tuplas a algo que JSON pueda representar"""
+	if isinstance(value, (bytes, bytearray, memoryview)):
+		return {_BYTES: base64.b64encode(value).decode()}
+	if isinstance(value, tuple):
+		return {_TUPLE: [_pack(item) for item in value]}
+	if isinstance(value, list):
+		return [_pack(item) for item in value]
+	if isinstance(value, dict):
+		return {key: _pack(item) for key, item in value.items()}
+	return value
+
+
+def _unpack(obj):
+	# object_hook de json: recibe cada objeto ya con su contenido decodificado
+	if len(obj) == 1:
+		if _BYTES in obj:
+			return base64.b64decode(obj[_BYTES])
+		if _TUPLE in obj:
+			return tuple(obj[_TUPLE])
+	return obj
+
+
+def _parse_address(address):
+	if address.startswith("unix:"):
+		return socket.AF_UNIX, address[len("unix:"):]
+	host, _, port = address.rpartition(":")
+	return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+class BrokerConnection:
+	"""Conexión con el broker (o, del lado del broker, con un worker)"""
+
+	def __init__(self, address=None, sock=None):
+		if sock is None:
+			family, addr = _parse_address(address)
+			sock = socket.socket(family, socket.SOCK_STREAM)
+			sock.connect(addr)
+		self.sock = sock
+		self._file = sock.makefile("rb")
+		self._lock = threading.Lock()
+
+	def send(self, message):
+		data = json.dumps(_pack(message), separators=(",", ":")).encode()
+		with self._lock:
+			self.sock.sendall(_LENGTH.pack(len(data)) + data)
+
+	def recv(self):
+		"""Leer el próximo mensaje; None si se cerró la conexión"""
+		header = self._file.read(_LENGTH.size)
+		if len(header) < _LENGTH.size:
+			return None
+		(length,) = _LENGTH.unpack(header)
+		return json.loads(self._file.read(length), object_hook=_unpack)
+
+	def close(self):
+		try:
+			# El makefile también retiene el socket: sin cerrarlo no se corta
+			self._file.close()
+			self.sock.close()
+		except OSError:
+			pass
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+	def handle(self):
+		broker = self.server.broker
+		conn = BrokerConnection(sock=self.request)
+		try:
+			while True:
+				message = conn.recv()
+				if message is None:
+					return
+				op = message.get("op")
+				if op == "publish":
+					broker.publish(message["channel"], message["data"])
+				elif op == "subscribe":
+					broker.subscribe(message["channel"], conn)
+				elif op == "call":
+					conn.send(broker.call(message["method"], message.get("args", []), owner=conn))
+		except (OSError, ValueError):
+			pass
+		finally:
+			broker.unsubscribe(conn)
+			broker.forget_owner(conn)
+			conn.close()
+
+
+class Broker:
+	"""Broker pub/sub con el RoomStore compartido"""
+
+	def __init__(self, address, store=None, channel="socketio"):
+		self.address = address
+		self.store = store or RoomStore()
+		self.channel = channel  # Canal de Socket.IO de los workers
+		self._store_lock = threading.Lock()
+		self._owned = {}  # conexión -> sids que entraron a salas a través de ella
+		self._subscribers = {}  # channel -> [BrokerConnection]
+		self._subs_lock = threading.Lock()
+
+		family, addr = _parse_address(address)
+		if family == socket.AF_UNIX:
+			server_class = socketserver.ThreadingUnixStreamServer
+		else:
+			server_class = socketserver.ThreadingTCPServer
+		server_class.daemon_threads = True
+		server_class.allow_reuse_address = True
+		self._server = server_class(addr, _BrokerHandler)
+		self._server.broker = self
+
+	def subscribe(self, channel, conn):
+		with self._subs_lock:
+			self._subscribers.setdefault(channel, []).append(conn)
+
+	def unsubscribe(self, conn):
+		with self._subs_lock:
+			for subscribers in self._subscribers.values():
+				if conn in subscribers:
+					subscribers.remove(conn)
+
+	def publish(self, channel, data):
+		with self._subs_lock:
+			subscribers = list(self._subscribers.get(channel, []))
+		for conn in subscribers:
+			try:
+				conn.send({"channel": channel, "data": data})
+			except OSError:
+				self.unsubscribe(conn)
+
+	def call(self, method, args, owner=None):
+		if method.startswith("_") or not hasattr(self.store, method):
+			return {"error": f"Método desconocido: {method}"}
+		try:
+			with self._store_lock:
+				result = getattr(self.store, method)(*args)
+				if owner is not None:
+					self._track(owner, method, args)
+				return {"result": result}
+		except Exception as e:
+			return {"error": str(e)}
+
+	def _track(self, owner, method, args):
+		# Qué sids tiene en salas cada worker, para limpiarlos si se cae
+		if method == "join":
+			self._owned.setdefault(owner, set()).add(args[1])
+		elif method == "leave":
+			self._owned.get(owner, set()).discard(args[0])
+
+	def forget_owner(self, conn):
+		"""Sacar de sus salas a los sids de un worker que se desconectó"""
+		with self._store_lock:
+			sids = self._owned.pop(conn, ())
+			left = []
+			for sid in sids:
+				entry = self.store.leave(sid)
+				if entry is None:
+					continue
+				code, user_id, _ = entry
+				# El mismo usuario puede seguir en la sala con otro sid
+				remaining = {uid for uid, _ in self.store.members(code).values()}
+				if user_id not in remaining:
+					left.append((code, user_id))
+		for code, user_id in left:
+			# Mismo formato que un emit de socketio.PubSubManager
+			self.publish(self.channel, {
+				"method": "emit", "event": "user_left", "data": {"id": user_id},
+				"namespace": "/", "room": code, "skip_sid": None, "callback": None,
+				"host_id": "broker",
+			})
+
+	def serve_forever(self):
+		self._server.serve_forever()
+
+	def start(self):
+		"""Atender conexiones en un hilo en segundo plano"""
+		thread = threading.Thread(target=self.serve_forever, daemon=True)
+		thread.start()
+		return thread
+
+	def shutdown(self):
+		self._server.shutdown()
+		self._server.server_close()
+		with self._store_lock:
+			self.store.close()
+
+
+class BrokerRoomStore:
+	"""RoomStore remoto: misma interfaz, cada llamada va al broker"""
+
+	def __init__(self, address):
+		self._conn = BrokerConnection(address)
+		self._lock = threading.Lock()
+
+	def _call(self, method, *args):
+		with self._lock:
+			self._conn.send({"op": "call", "method": method, "args": list(args)})
+			reply = self._conn.recv()
+		if reply is None:
+			raise ConnectionError("Se perdió la conexión con el broker")
+		if "error" in reply:
+			raise RuntimeError(reply["error"])
+		return reply["result"]
+
+	def __getattr__(self, method):
+		if method.startswith("_"):
+			raise AttributeError(method)
+		return lambda *args: self._call(method, *args)
+
+
+class BrokerManager(socketio.PubSubManager, VoiceQueueManager):
+	"""Client manager de Socket.IO sobre el broker local
+
+	Además de los mensajes de Socket.IO, reparte mensajes propios del
+	servidor (method="relay") al callback `on_relay`. La voz que se entrega
+	a los clientes de este worker pasa por las colas de VoiceQueueManager.
+	"""
+	name = "broker"
+
+	def __init__(self, address, channel="socketio", write_only=False, logger=None, on_relay=None):
+		super().__init__(channel=channel, write_only=write_only, logger=logger)
+		self.address = address
+		self.on_relay = on_relay
+		self._pub = BrokerConnection(address)
+
+	def _publish(self, data):
+		self._pub.send({"op": "publish", "channel": self.channel, "data": data})
+
+	def relay(self, data):
+		"""Publicar un mensaje propio del servidor para los demás workers"""
+		self._publish({"method": "relay", "host_id": self.host_id, "data": data})
+
+	def _listen(self):
+		sub = BrokerConnection(self.address)
+		sub.send({"op": "subscribe", "channel": self.channel})
+		while True:
+			message = sub.recv()
+			if message is None:
+				return
+			data = message.get("data")
+			if isinstance(data, dict) and data.get("method") == "relay":
+				if data.get("host_id") != self.host_id and self.on_relay:
+					self.on_relay(data["data"])
+				continue
+			yield data
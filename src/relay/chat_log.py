@@ -0,0 +1,40 @@
+import json
+import time
+
+# Registro del chat en disco.
+#
+# Archivo de solo agregado con una línea JSON por mensaje. Las líneas se
+# acumulan en memoria y se escriben juntas cuando pasan de `max_pending` o
+# de `flush_interval` segundos, así un chat activo no hace una escritura por
+# mensaje. Para que una sala en silencio no deje líneas pendientes, el
+# servidor llama a `flush` cada `flush_interval` (ver chat_flush_loop en
+# server.py) y al terminar.
+
+
+class ChatLog:
+	"""Escritor de mensajes de chat con escrituras agrupadas"""
+
+	def __init__(self, path, max_pending=64, flush_interval=2.0):
+		self.path = path
+		self.max_pending = max_pending
+		self.flush_interval = flush_interval
+		self._file = open(path, "a", encoding="utf-8")
+		self._pending = []
+		self._last_flush = time.monotonic()
+
+	def append(self, code, msg):
+		self._pending.append(json.dumps({"time": time.time(), "room": code, "msg": msg}, ensure_ascii=False))
+		if len(self._pending) >= self.max_pending or time.monotonic() - self._last_flush >= self.flush_interval:
+			self.flush()
+
+	def flush(self):
+		self._last_flush = time.monotonic()
+		if not self._pending:
+			return
+		self._file.write("\n".join(self._pending) + "\n")
+		self._file.flush()
+		self._pending = []
+
+	def close(self):
+		self.flush()
+		self._file.close()
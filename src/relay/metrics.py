@@ -0,0 +1,227 @@
+# Métricas del servidor en formato de texto de Prometheus.
+#
+# El servidor las sirve en /metrics desde la misma app WSGI (o ASGI) que Socket.IO
+# (ver server.py). Todo vive en memoria del proceso: con varios workers cada
+# uno expone las suyas con la etiqueta `worker`, y /metrics responde el
+# worker que acepte la conexión. La excepción es voicechat_rooms_active, que
+# sale del store compartido y vale lo mismo en todos: va sin `worker` para
+# que sumar por worker no la cuente N veces.
+import time
+
+# Límites (segundos) de los histogramas de duración
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _escape(value):
+	return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels):
+	if not labels:
+		return ""
+	return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Histogram:
+	"""Histograma acumulativo con límites fijos"""
+
+	def __init__(self, buckets=DURATION_BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * len(buckets)
+		self.count = 0
+		self.sum = 0.0
+
+	def observe(self, value):
+		self.count += 1
+		self.sum += value
+		for i, bound in enumerate(self.buckets):
+			if value <= bound:
+				self.counts[i] += 1
+				break
+
+	def render(self, name, labels=()):
+		lines = []
+		cumulative = 0
+		for bound, count in zip(self.buckets, self.counts):
+			cumulative += count
+			lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {cumulative}")
+		lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {self.count}")
+		lines.append(f"{name}_sum{_labels(labels)} {self.sum}")
+		lines.append(f"{name}_count{_labels(labels)} {self.count}")
+		return lines
+
+
+class RoomCounters:
+	__slots__ = ("packets_in", "bytes_in", "packets_out", "bytes_out")
+
+	def __init__(self):
+		self.packets_in = 0
+		self.bytes_in = 0
+		self.packets_out = 0
+		self.bytes_out = 0
+
+
+class ServerMetrics:
+	"""Contadores por sala, duraciones de emit y retardo del event loop"""
+
+	def __init__(self, worker=0, reconnect_window=60.0):
+		self.worker = str(worker)
+		self.reconnect_window = reconnect_window
+		self.rooms = {}  # code -> RoomCounters
+		self.emit_duration = {}  # evento -> Histogram
+		self.loop_lag = Histogram()
+		self.last_loop_lag = 0.0
+		self.connects = 0
+		self.disconnects = 0
+		self.reconnects = 0
+		# user_id -> hora de desconexión, para reconocer reconexiones
+		self._recently_left = {}
+		# Fuentes de los gauges; las fija el servidor
+		self.active_rooms = lambda: 0
+		self.active_sids = lambda: 0
+		# Contrapresión de voz por oyente (ver relay/outbound.py)
+		self.slow_clients = lambda: 0
+		self.slow_episodes = lambda: 0
+		self.voice_dropped = lambda: 0
+		# Plano de medios UDP (ver relay/udp_relay.py)
+		self.udp_peers = lambda: 0
+		self.udp_datagrams_in = lambda: 0
+		self.udp_datagrams_out = lambda: 0
+		self.udp_lost = lambda: 0
+
+	def _room(self, code):
+		counters = self.rooms.get(code)
+		if counters is None:
+			counters = self.rooms[code] = RoomCounters()
+		return counters
+
+	def voice_in(self, code, size):
+		counters = self._room(code)
+		counters.packets_in += 1
+		counters.bytes_in += size
+
+	def voice_out(self, code, size, listeners=1):
+		counters = self._room(code)
+		counters.packets_out += listeners
+		counters.bytes_out += size * listeners
+
+	def forget_room(self, code):
+		self.rooms.pop(code, None)
+
+	def observe_emit(self, event, seconds):
+		histogram = self.emit_duration.get(event)
+		if histogram is None:
+			histogram = self.emit_duration[event] = Histogram()
+		histogram.observe(seconds)
+
+	def on_connect(self):
+		self.connects += 1
+
+	def on_disconnect(self, user_id=None):
+		self.disconnects += 1
+		if user_id is not None:
+			self._recently_left[user_id] = time.monotonic()
+
+	def on_join(self, user_id):
+		"""Contar como reconexión si el usuario se fue hace poco"""
+		left_at = self._recently_left.pop(user_id, None)
+		if left_at is not None and time.monotonic() - left_at <= self.reconnect_window:
+			self.reconnects += 1
+
+	def observe_loop_lag(self, seconds):
+		self.last_loop_lag = seconds
+		self.loop_lag.observe(seconds)
+
+	def _expire_recently_left(self):
+		limit = time.monotonic() - self.reconnect_window
+		for user_id, left_at in list(self._recently_left.items()):
+			if left_at < limit:
+				del self._recently_left[user_id]
+
+	def render(self):
+		"""Texto de exposición de Prometheus (versión 0.0.4)"""
+		self._expire_recently_left()
+		worker = (("worker", self.worker),)
+		lines = []
+
+		def metric(name, kind, help_text):
+			lines.append(f"# HELP {name} {help_text}")
+			lines.append(f"# TYPE {name} {kind}")
+
+		metric("voicechat_rooms_active", "gauge", "Salas con al menos un miembro en todo el servidor")
+		lines.append(f"voicechat_rooms_active {self.active_rooms()}")
+		metric("voicechat_sids_active", "gauge", "Conexiones en una sala en este worker")
+		lines.append(f"voicechat_sids_active{_labels(worker)} {self.active_sids()}")
+
+		rooms = list(self.rooms.items())
+		for field, name, help_text in (
+			("packets_in", "voicechat_voice_packets_in_total", "Paquetes de voz recibidos por sala"),
+			("bytes_in", "voicechat_voice_bytes_in_total", "Bytes de voz recibidos por sala"),
+			("packets_out", "voicechat_voice_packets_out_total", "Paquetes de voz enviados por sala (uno por oyente)"),
+			("bytes_out", "voicechat_voice_bytes_out_total", "Bytes de voz enviados por sala"),
+		):
+			metric(name, "counter", help_text)
+			for code, counters in rooms:
+				lines.append(f"{name}{_labels(worker + (('room', code),))} {getattr(counters, field)}")
+
+		metric("voicechat_emit_duration_seconds", "histogram", "Duración de sio.emit por evento")
+		for event, histogram in list(self.emit_duration.items()):
+			lines.extend(histogram.render("voicechat_emit_duration_seconds", worker + (("event", event),)))
+
+		metric("voicechat_connects_total", "counter", "Conexiones aceptadas")
+		lines.append(f"voicechat_connects_total{_labels(worker)} {self.connects}")
+		metric("voicechat_disconnects_total", "counter", "Desconexiones")
+		lines.append(f"voicechat_disconnects_total{_labels(worker)} {self.disconnects}")
+		metric("voicechat_reconnects_total", "counter", "Usuarios que vuelven a entrar poco después de irse")
+		lines.append(f"voicechat_reconnects_total{_labels(worker)} {self.reconnects}")
+
+		metric("voicechat_slow_clients", "gauge", "Oyentes con voz encolada porque su conexión no da abasto")
+		lines.append(f"voicechat_slow_clients{_labels(worker)} {self.slow_clients()}")
+		metric("voicechat_slow_client_episodes_total", "counter", "Veces que un oyente empezó a atrasarse")
+		lines.append(f"voicechat_slow_client_episodes_total{_labels(worker)} {self.slow_episodes()}")
+		metric("voicechat_voice_dropped_total", "counter", "Paquetes de voz descartados por oyentes atrasados")
+		lines.append(f"voicechat_voice_dropped_total{_labels(worker)} {self.voice_dropped()}")
+
+		metric("voicechat_udp_peers", "gauge", "Clientes que reciben la voz por UDP")
+		lines.append(f"voicechat_udp_peers{_labels(worker)} {self.udp_peers()}")
+		metric("voicechat_udp_datagrams_in_total", "counter", "Datagramas UDP válidos recibidos")
+		lines.append(f"voicechat_udp_datagrams_in_total{_labels(worker)} {self.udp_datagrams_in()}")
+		metric("voicechat_udp_datagrams_out_total", "counter", "Datagramas UDP enviados")
+		lines.append(f"voicechat_udp_datagrams_out_total{_labels(worker)} {self.udp_datagrams_out()}")
+		metric("voicechat_udp_lost_total", "counter", "Datagramas de voz de los clientes que no llegaron")
+		lines.append(f"voicechat_udp_lost_total{_labels(worker)} {self.udp_lost()}")
+
+		metric("voicechat_event_loop_lag_seconds", "histogram", "Retraso del event loop sobre el periodo esperado")
+		lines.extend(self.loop_lag.render("voicechat_event_loop_lag_seconds", worker))
+		metric("voicechat_event_loop_lag_last_seconds", "gauge", "Última medida de retraso del event loop")
+		lines.append(f"voicechat_event_loop_lag_last_seconds{_labels(worker)} {self.last_loop_lag}")
+
+		return "\n".join(lines) + "\n"
+
+	async def asgi_app(self, scope, receive, send):
+		"""Lo mismo que wsgi_app para el backend asyncio (ASGI)"""
+		if scope["type"] != "http":
+			return
+		if scope.get("path", "").rstrip("/") != "/metrics":
+			status, headers, body = 404, [(b"content-type", b"text/plain")], b"Not Found"
+		else:
+			body = self.render().encode()
+			status = 200
+			headers = [
+				(b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+				(b"content-length", str(len(body)).encode()),
+			]
+		await send({"type": "http.response.start", "status": status, "headers": headers})
+		await send({"type": "http.response.body", "body": body})
+
+	def wsgi_app(self, environ, start_response):
+		"""App WSGI para las rutas que no son de Socket.IO"""
+		if environ.get("PATH_INFO", "").rstrip("/") != "/metrics":
+			start_response("404 Not Found", [("Content-Type", "text/plain")])
+			return [b"Not Found"]
+		body = self.render().encode()
+		start_response("200 OK", [
+			("Content-Type", "text/plain; version=0.0.4; charset=utf-8"),
+			("Content-Length", str(len(body))),
+		])
+		return [body]
@@ -0,0 +1,142 @@
+from collections import deque
+import numpy as np
+from audio.frame import decode_frames, encode_frame, with_seq, FrameError
+from audio.mixer import stack_frames, mix_minus
+from audio.resample import Resampler
+
+# Modo de mezcla en el servidor (MCU).
+#
+# En lugar de reenviar el paquete de cada hablante a todos los miembros de
+# la sala, el servidor acumula los bloques recibidos y, en cada tick del
+# reloj de la sala, envía a cada oyente una única mezcla sin su propia voz.
+# Cada oyente tiene su propia numeración: el que habla solo no recibe nada
+# en esos ticks, y al recibir de nuevo no ve un salto de secuencia.
+
+
+class RoomMixer:
+	"""Estado de mezcla de una sala"""
+
+	def __init__(self, default_period=0.04, max_pending=3):
+		self.default_period = default_period
+		self.max_pending = max_pending
+		self.samplerate = None
+		self.channels = 1
+		self.frame_length = None
+		self._pending = {}
+		self._resamplers = {}
+		self._seqs = {}  # sid -> última secuencia enviada a ese oyente
+
+	@property
+	def period(self):
+		"""Duración del tick: la del primer bloque recibido en la sala"""
+		if self.frame_length is None:
+			return self.default_period
+		return self.frame_length / self.samplerate
+
+	def push(self, sid, payload):
+		"""Guardar las tramas de un paquete recibido de `sid` para los próximos ticks"""
+		try:
+			frames = decode_frames(payload)
+		except FrameError as e:
+			print(f"Paquete descartado de {sid}: {e}")
+			return
+		for data, header in frames:
+			self._push_frame(sid, data, header)
+
+	def _push_frame(self, sid, data, header):
+		samplerate = header.samplerate
+		if self.samplerate is None:
+			self.samplerate = samplerate
+			self.channels = data.shape[1]
+			self.frame_length = data.shape[0]
+		if samplerate != self.samplerate:
+			# Cada cliente elige su frecuencia: se lleva a la de la sala
+			resampler = self._resamplers.get(sid)
+			if resampler is None or resampler.src_rate != samplerate:
+				resampler = self._resamplers[sid] = Resampler(samplerate, self.samplerate, data.shape[1])
+			data = resampler.process(data)
+
+		# Los clientes pueden cambiar de tamaño de trama (audio/adaptive.py):
+		# la cola se limita en muestras y cada tick consume `frame_length`
+		queue = self._pending.get(sid)
+		if queue is None:
+			queue = self._pending[sid] = _SampleQueue()
+		queue.append(data, header.timestamp)
+		queue.trim(self.max_pending * self.frame_length)
+
+	def forget(self, sid):
+		self._pending.pop(sid, None)
+		self._resamplers.pop(sid, None)
+		self._seqs.pop(sid, None)
+
+	def tick(self, members, codec):
+		"""Mezclar un periodo y devolver [(sid, paquete)] para cada oyente"""
+		speakers = [sid for sid, queue in self._pending.items() if queue.available]
+		if not speakers:
+			return []
+
+		popped = [self._pending[sid].pop(self.frame_length) for sid in speakers]
+		frames = [data for data, _ in popped]
+		# La mezcla lleva la hora de captura más antigua de sus fuentes
+		timestamp = min(ts for _, ts in popped)
+		total, partial = mix_minus(stack_frames(frames, self.frame_length, self.channels))
+		index = {sid: i for i, sid in enumerate(speakers)}
+
+		packets = []
+		# Todos los que no hablan reciben la misma mezcla: se codifica una vez
+		# y a cada uno solo se le cambia la secuencia
+		total_packet = None
+		for sid in members:
+			i = index.get(sid)
+			if i is not None and len(speakers) == 1:
+				# Es el único hablante: no hay nada que mezclar para él
+				continue
+			seq = self._seqs[sid] = (self._seqs.get(sid, 0) + 1) & 0xFFFFFFFF
+			if i is None:
+				if total_packet is None:
+					total_packet = encode_frame(total, self.samplerate, codec, seq, timestamp)
+					packet = total_packet
+				else:
+					packet = with_seq(total_packet, seq)
+			else:
+				packet = encode_frame(partial[i], self.samplerate, codec, seq, timestamp)
+			packets.append((sid, packet))
+		return packets
+
+
+class _SampleQueue:
+	"""Bloques pendientes de un hablante, consumidos por cantidad de muestras"""
+
+	def __init__(self):
+		self._chunks = deque()  # (bloque, hora de captura)
+		self._offset = 0
+		self.available = 0
+
+	def append(self, data, timestamp):
+		self._chunks.append((data, timestamp))
+		self.available += len(data)
+
+	def trim(self, limit):
+		"""Descartar los bloques más antiguos si se pasa de `limit` muestras"""
+		while self.available > limit and len(self._chunks) > 1:
+			oldest, _ = self._chunks.popleft()
+			self.available -= len(oldest) - self._offset
+			self._offset = 0
+
+	def pop(self, length):
+		"""Devolver (hasta `length` muestras, hora de captura de la primera)"""
+		parts = []
+		timestamp = self._chunks[0][1]
+		while length > 0 and self._chunks:
+			data, _ = self._chunks[0]
+			part = data[self._offset:self._offset + length]
+			parts.append(part)
+			length -= len(part)
+			self._offset += len(part)
+			self.available -= len(part)
+			if self._offset >= len(data):
+				self._chunks.popleft()
+				self._offset = 0
+		if len(parts) == 1:
+			return parts[0], timestamp
+		return np.concatenate(parts), timestamp
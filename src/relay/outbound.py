@@ -0,0 +1,189 @@
+import asyncio
+from collections import deque
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+# Contrapresión por oyente en el relay.
+#
+# Los emits de voz no van directo a la cola del transporte de cada cliente:
+# pasan por una cola acotada por sid que descarta lo más antiguo. Solo se
+# pasa audio al transporte mientras este tenga poco pendiente, así que un
+# cliente lento no hace crecer la memoria del servidor ni retrasa a los
+# demás. El chat y los mensajes de control van directo al transporte y
+# adelantan a la voz encolada. Los oyentes que se presentaron por UDP (ver
+# relay/udp_relay.py) reciben la voz por ahí y no usan la cola.
+
+VOICE_EVENT = "voice"
+
+
+class VoiceQueues:
+	"""Colas de voz acotadas por oyente, comunes a los client managers
+	síncrono (VoiceQueueManager) y asyncio (AsyncVoiceQueueManager)"""
+
+	# Mensajes de voz por oyente a la espera de que su transporte se vacíe
+	VOICE_QUEUE = 10
+	# Paquetes de Engine.IO pendientes en el transporte a partir de los
+	# cuales se deja de pasarle voz (cada mensaje de voz son dos)
+	TRANSPORT_BACKLOG = 8
+	# Cada cuánto se reintenta vaciar las colas de los oyentes atrasados
+	FLUSH_INTERVAL = 0.02
+	# UdpRelay opcional; lo fija el servidor
+	media = None
+
+	def __init__(self):
+		super().__init__()
+		self._voice_queues = {}  # eio_sid -> deque de mensajes (lista de paquetes)
+		self._backlogged = set()  # eio_sid con voz esperando
+		self.voice_dropped = 0
+		self.slow_episodes = 0
+
+	@property
+	def slow_clients(self):
+		return len(self._backlogged)
+
+	def _is_voice(self, event, data, namespace, callback):
+		return event == VOICE_EVENT and not callback and namespace in self.rooms and data is not None
+
+	def _route_voice(self, event, data, namespace, room, skip_sid):
+		"""Mandar la voz por UDP a quien se pueda y encolarla para el resto"""
+		data = list(data) if isinstance(data, tuple) else [data]
+		if not isinstance(skip_sid, list):
+			skip_sid = [skip_sid]
+		message = None
+		for sid, eio_sid in self.get_participants(namespace, room):
+			if sid in skip_sid:
+				continue
+			if self.media is not None and self.media.send_voice(sid, *data):
+				continue
+			if message is None:
+				# Se codifica una sola vez y se reutiliza para todos los oyentes
+				message = self._encode_voice(event, data, namespace)
+			self._queue_voice(eio_sid, message)
+
+	def _encode_voice(self, event, data, namespace):
+		encoded = self.server.packet_class(
+			packet.EVENT, namespace=namespace, data=[event] + data).encode()
+		if not isinstance(encoded, list):
+			encoded = [encoded]
+		return [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+
+	def _queue_voice(self, eio_sid, message):
+		queue = self._voice_queues.get(eio_sid)
+		if queue is None:
+			queue = self._voice_queues[eio_sid] = deque()
+		if len(queue) >= self.VOICE_QUEUE:
+			# Descartar el más antiguo: al oyente le sirve más lo reciente
+			queue.popleft()
+			self.voice_dropped += 1
+		queue.append(message)
+		self._flush(eio_sid, queue)
+
+	def _transport_backlog(self, eio_sid):
+		"""Paquetes pendientes en el transporte; None si el cliente ya no está"""
+		socket = self.server.eio.sockets.get(eio_sid)
+		if socket is None or socket.closed:
+			return None
+		return socket.queue.qsize()
+
+	def _send_voice_packet(self, eio_sid, p):
+		self.server._send_eio_packet(eio_sid, p)
+
+	def _flush(self, eio_sid, queue):
+		"""Pasar voz al transporte mientras tenga sitio"""
+		backlog = self._transport_backlog(eio_sid)
+		if backlog is None:
+			self._forget_voice(eio_sid)
+			return
+		while queue and backlog < self.TRANSPORT_BACKLOG:
+			for p in queue.popleft():
+				self._send_voice_packet(eio_sid, p)
+			backlog += 2
+		if queue:
+			if eio_sid not in self._backlogged:
+				self._backlogged.add(eio_sid)
+				self.slow_episodes += 1
+		else:
+			self._backlogged.discard(eio_sid)
+
+	def _flush_backlogged(self):
+		for eio_sid in list(self._backlogged):
+			queue = self._voice_queues.get(eio_sid)
+			if queue is None:
+				self._backlogged.discard(eio_sid)
+			else:
+				self._flush(eio_sid, queue)
+
+	def _forget_voice(self, eio_sid):
+		self._voice_queues.pop(eio_sid, None)
+		self._backlogged.discard(eio_sid)
+
+	def _forget_sid(self, sid, namespace):
+		eio_sid = self.eio_sid_from_sid(sid, namespace or "/")
+		if eio_sid is not None:
+			self._forget_voice(eio_sid)
+
+
+class VoiceQueueManager(VoiceQueues, socketio.Manager):
+	"""Client manager de Socket.IO con cola de voz acotada por oyente
+
+	Con varios workers va detrás de `socketio.PubSubManager` en la jerarquía
+	(ver relay/broker.py), así los emits que llegan de otros workers también
+	pasan por las colas.
+	"""
+
+	def initialize(self):
+		super().initialize()
+		if not getattr(self, "write_only", False):
+			self.server.start_background_task(self._flush_loop)
+
+	def emit(self, event, data, namespace, room=None, skip_sid=None,
+			 callback=None, to=None, **kwargs):
+		if not self._is_voice(event, data, namespace, callback):
+			return super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+								callback=callback, to=to, **kwargs)
+		self._route_voice(event, data, namespace, to or room, skip_sid)
+
+	def _flush_loop(self):
+		while True:
+			self.server.sleep(self.FLUSH_INTERVAL)
+			self._flush_backlogged()
+
+	def disconnect(self, sid, namespace, **kwargs):
+		self._forget_sid(sid, namespace)
+		return super().disconnect(sid, namespace, **kwargs)
+
+
+class AsyncVoiceQueueManager(VoiceQueues, socketio.AsyncManager):
+	"""Lo mismo que VoiceQueueManager para socketio.AsyncServer"""
+
+	def initialize(self):
+		super().initialize()
+		self._send_tasks = set()  # Envíos en curso (ver _send_voice_packet)
+		self.server.start_background_task(self._flush_loop)
+
+	async def emit(self, event, data, namespace, room=None, skip_sid=None,
+				   callback=None, to=None, **kwargs):
+		if not self._is_voice(event, data, namespace, callback):
+			return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+									  callback=callback, to=to, **kwargs)
+		self._route_voice(event, data, namespace, to or room, skip_sid)
+
+	def _send_voice_packet(self, eio_sid, p):
+		# Arranca en el acto: los dos paquetes de cada mensaje no se
+		# desordenan ni esperan al próximo ciclo del loop. Si queda
+		# esperando se guarda la tarea: el loop solo la referencia débilmente
+		task = asyncio.eager_task_factory(
+			asyncio.get_running_loop(), self.server._send_eio_packet(eio_sid, p))
+		if not task.done():
+			self._send_tasks.add(task)
+			task.add_done_callback(self._send_tasks.discard)
+
+	async def _flush_loop(self):
+		while True:
+			await self.server.sleep(self.FLUSH_INTERVAL)
+			self._flush_backlogged()
+
+	async def disconnect(self, sid, namespace, **kwargs):
+		self._forget_sid(sid, namespace)
+		return await super().disconnect(sid, namespace, **kwargs)
@@ -0,0 +1,107 @@
+# Estado de las salas del servidor.
+#
+# RoomStore guarda quién está en cada sala, los códecs que acepta cada sid,
+# el códec elegido por sala y los últimos mensajes de chat de cada sala (cada
+# uno con un id único, para que el cliente no repita los que ya mostró cuando
+# vuelve a recibir el historial al reconectar). Con
+# un solo proceso se usa directamente; con varios workers vive dentro del
+# broker (ver relay/broker.py) y los workers lo consultan a través de
+# BrokerRoomStore, que tiene la misma interfaz.
+import uuid
+from collections import deque
+
+
+class RoomStore:
+	"""Salas, miembros, códecs y chat reciente en memoria"""
+
+	def __init__(self, chat_history=50, chat_log=None):
+		self._rooms = {}  # code -> {sid: (user_id, name)}
+		self._sid_room = {}  # sid -> code
+		self._sid_codecs = {}  # sid -> [códecs aceptados]
+		self._room_codecs = {}  # code -> códec elegido
+		self._chat = {}  # code -> deque con los últimos (id, mensaje)
+		# Ids de chat: prefijo propio de este store (no se repiten tras
+		# reiniciar el servidor) y un contador
+		self._chat_prefix = uuid.uuid4().hex[:8]
+		self._chat_seq = 0
+		self.chat_history = chat_history
+		self.chat_log = chat_log  # ChatLog opcional (ver relay/chat_log.py)
+
+	def join(self, code, sid, user_id, name, codecs):
+		self._rooms.setdefault(code, {})[sid] = (user_id, name)
+		self._sid_room[sid] = code
+		self._sid_codecs[sid] = list(codecs)
+
+	def leave(self, sid):
+		"""Quitar a `sid` de su sala; devuelve (code, user_id, name) o None
+
+		Las salas que quedan vacías se eliminan.
+		"""
+		code = self._sid_room.pop(sid, None)
+		self._sid_codecs.pop(sid, None)
+		if code is None:
+			return None
+		members = self._rooms.get(code, {})
+		user_id, name = members.pop(sid, (None, None))
+		if not members:
+			self._rooms.pop(code, None)
+			self._room_codecs.pop(code, None)
+			self._chat.pop(code, None)
+		return code, user_id, name
+
+	def room_of(self, sid):
+		return self._sid_room.get(sid)
+
+	def members(self, code):
+		"""Miembros de la sala como {sid: (user_id, name)}"""
+		return dict(self._rooms.get(code, {}))
+
+	def roster(self, code):
+		"""Lista de usuarios de la sala para enviar a quien entra"""
+		return [{"id": user_id, "name": name} for user_id, name in self._rooms.get(code, {}).values()]
+
+	def rooms(self):
+		return list(self._rooms)
+
+	def add_chat(self, code, msg):
+		"""Guardar un mensaje en el historial acotado de la sala; devuelve su id"""
+		self._chat_seq += 1
+		msg_id = f"{self._chat_prefix}-{self._chat_seq}"
+		history = self._chat.get(code)
+		if history is None:
+			history = self._chat[code] = deque(maxlen=self.chat_history)
+		history.append((msg_id, msg))
+		if self.chat_log is not None:
+			self.chat_log.append(code, msg)
+		return msg_id
+
+	def chat_backlog(self, code):
+		"""Últimos mensajes de la sala como [id, mensaje], del más viejo al más nuevo"""
+		return [[msg_id, msg] for msg_id, msg in self._chat.get(code, ())]
+
+	def flush_chat(self):
+		"""Escribir lo pendiente del registro de chat (lo llama el servidor periódicamente)"""
+		if self.chat_log is not None:
+			self.chat_log.flush()
+
+	def close(self):
+		if self.chat_log is not None:
+			self.chat_log.close()
+
+	def room_codec(self, code, default):
+		return self._room_codecs.get(code, default)
+
+	def negotiate_codec(self, code, preference, default):
+		"""Elegir el primer códec de `preference` que entiendan todos los de la sala"""
+		members = [self._sid_codecs.get(sid, [default]) for sid in self._rooms.get(code, {})]
+		codec = next(
+			(c for c in preference if all(c in accepted for accepted in members)),
+			default,
+		)
+		current = self._room_codecs.get(code)
+		if current is not None and all(current in accepted for accepted in members):
+			# Mantener el códec actual mientras siga siendo válido para todos
+			codec = current
+
+		self._room_codecs[code] = codec
+		return codec
@@ -0,0 +1,133 @@
+import os
+import time
+from utils.datagram import (
+	HELLO,
+	MAX_DATAGRAM,
+	TOKEN_SIZE,
+	VOICE,
+	DatagramError,
+	pack_datagram,
+	seq_advance,
+	unpack_datagram,
+)
+
+# Relay de voz por UDP junto a Socket.IO.
+#
+# Cada sid que entra a una sala recibe por Socket.IO un token (evento
+# 'media'). Los datagramas del cliente traen ese token, así el relay sabe de
+# qué sid son sin otra tabla de salas: la voz que llega por UDP entra por el
+# mismo handler que la de Socket.IO y se reparte con las mismas salas del
+# client manager. A la hora de entregar, VoiceQueueManager (ver
+# relay/outbound.py) manda por UDP a los oyentes presentados y por Socket.IO
+# al resto.
+
+
+class UdpRelay:
+	"""Plano de medios UDP del servidor sobre un socket ya enlazado"""
+
+	# Sin datagramas del cliente por más de esto (s) se le vuelve a mandar la
+	# voz por Socket.IO; el cliente manda HELLO cada pocos segundos
+	PEER_TIMEOUT = 10.0
+
+	def __init__(self, sock, port, on_voice):
+		self.sock = sock
+		self.port = port  # Puerto que se anuncia a los clientes
+		self.on_voice = on_voice  # on_voice(sid, paquete)
+		self._token_sid = {}  # token -> sid
+		self._sid_token = {}  # sid -> token
+		self._peers = {}  # sid -> dirección de la que llegó el último datagrama
+		self._last_seen = {}  # sid -> hora (monótona) del último datagrama
+		self._in_seq = {}  # sid -> última secuencia recibida
+		self._out_seq = {}  # sid -> última secuencia enviada
+		self._closed = False
+		self.datagrams_in = 0
+		self.datagrams_out = 0
+		self.lost = 0  # Datagramas de los clientes que no llegaron
+		self.rejected = 0  # Datagramas con formato o token inválido
+
+	@property
+	def peers(self):
+		return len(self._peers)
+
+	def register(self, sid):
+		"""Token (hex) con el que `sid` se presenta por UDP"""
+		token = self._sid_token.get(sid)
+		if token is None:
+			token = os.urandom(TOKEN_SIZE)
+			self._sid_token[sid] = token
+			self._token_sid[token] = sid
+		return token.hex()
+
+	def forget(self, sid):
+		token = self._sid_token.pop(sid, None)
+		if token is not None:
+			self._token_sid.pop(token, None)
+		self._peers.pop(sid, None)
+		self._last_seen.pop(sid, None)
+		self._in_seq.pop(sid, None)
+		self._out_seq.pop(sid, None)
+
+	def serve(self):
+		"""Recibir datagramas hasta close() (tarea de fondo del servidor)"""
+		while not self._closed:
+			try:
+				data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+			except OSError:
+				# P. ej. ICMP de un puerto cerrado del lado del cliente
+				continue
+			try:
+				self.handle_datagram(data, addr)
+			except Exception as e:
+				# Un paquete que falla en el handler no corta la recepción
+				print(f"Error en el relay UDP: {e}")
+
+	def handle_datagram(self, data, addr):
+		try:
+			datagram = unpack_datagram(data)
+		except DatagramError:
+			self.rejected += 1
+			return
+		sid = self._token_sid.get(datagram.token)
+		if sid is None:
+			self.rejected += 1
+			return
+
+		self.datagrams_in += 1
+		# La dirección puede cambiar (p. ej. el NAT reasigna el puerto)
+		self._peers[sid] = addr
+		self._last_seen[sid] = time.monotonic()
+		if datagram.kind == HELLO:
+			self._send(addr, pack_datagram(HELLO, datagram.token))
+		elif datagram.payload:
+			last, lost = seq_advance(self._in_seq.get(sid), datagram.seq)
+			self._in_seq[sid] = last
+			self.lost += lost
+			self.on_voice(sid, bytes(datagram.payload))
+
+	def send_voice(self, sid, sender, payload, relay_time=0.0):
+		"""Mandar un paquete de voz a `sid` por UDP; False si no se puede"""
+		addr = self._peers.get(sid)
+		if addr is None:
+			return False
+		if time.monotonic() - self._last_seen[sid] > self.PEER_TIMEOUT:
+			self._peers.pop(sid, None)
+			return False
+		seq = (self._out_seq.get(sid, 0) + 1) & 0xFFFFFFFF
+		try:
+			data = pack_datagram(
+				VOICE, seq=seq, relay_time=relay_time, sender=str(sender).encode(), payload=payload,
+			)
+			self._send(addr, data)
+		except (OSError, DatagramError):
+			# Paquete de varias tramas que no entra, o error de red: por Socket.IO
+			return False
+		self._out_seq[sid] = seq
+		return True
+
+	def _send(self, addr, data):
+		self.sock.sendto(data, addr)
+		self.datagrams_out += 1
+
+	def close(self):
+		self._closed = True
+		self.sock.close()
@@ -0,0 +1,109 @@
+import time
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from queue import Empty
+from utils.shm_ring import SharedAudioRing
+
+# Canal multiplexado entre procesos, uno por dirección.
+#
+# El audio viaja por un SharedAudioRing (sin pickle) y todo lo demás (chat,
+# usuarios, control) por un Pipe. El consumidor espera en un único punto
+# (`recv`) a cualquiera de los dos, sin sondear con timeouts.
+#
+# put_audio corre en el callback de audio: no toma locks ni serializa nada.
+# Solo si el consumidor marcó en la cabecera del ring que va a bloquearse se
+# toca el "timbre", un Pipe aparte del que solo escribe el productor del
+# ring (un mensaje de un byte con send_bytes, sin pickle). El consumidor
+# marca la espera y recién después vuelve a mirar el ring: si el productor
+# llegara a leer la marca vieja, la marca queda puesta y el bloque siguiente
+# toca el timbre, así que a lo sumo se atrasa un bloque.
+
+AUDIO = "audio"
+STOP = "stop"
+
+
+class Channel:
+    """Canal unidireccional: audio por memoria compartida y mensajes por Pipe"""
+
+    def __init__(self, slots=64, slot_size=32768):
+        self.audio = SharedAudioRing(slots=slots, slot_size=slot_size, wakeup=False)
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+        self._bell_reader, self._bell_writer = multiprocessing.Pipe(duplex=False)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {
+            "audio": self.audio,
+            "reader": self._reader,
+            "writer": self._writer,
+            "bell_reader": self._bell_reader,
+            "bell_writer": self._bell_writer,
+        }
+
+    def __setstate__(self, state):
+        self.audio = state["audio"]
+        self._reader = state["reader"]
+        self._writer = state["writer"]
+        self._bell_reader = state["bell_reader"]
+        self._bell_writer = state["bell_writer"]
+        self._lock = threading.Lock()
+
+    def _send(self, message):
+        with self._lock:
+            self._writer.send(message)
+
+    def put_audio(self, payload, tag=b""):
+        """Publicar un bloque de audio. Un solo productor, sin locks."""
+        self.audio.put(payload, tag)
+        if self.audio.consumer_waiting:
+            self._bell_writer.send_bytes(b"\x01")
+
+    def put(self, kind, payload=None):
+        """Enviar un mensaje de control (chat, usuarios...)"""
+        self._send((kind, payload))
+
+    def stop(self):
+        """Despertar al consumidor para que termine"""
+        self._send((STOP, None))
+
+    def recv(self, timeout=None):
+        """Esperar al próximo mensaje y devolver (tipo, datos)
+
+        Con bloques de audio pendientes devuelve (AUDIO, None); se leen con
+        drain_audio().
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self._reader.poll():
+                return self._reader.recv()
+            if self.audio.pending:
+                return AUDIO, None
+
+            self.audio.set_waiting(True)
+            try:
+                # Volver a mirar con la marca ya puesta (ver arriba)
+                if self.audio.pending:
+                    return AUDIO, None
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not wait([self._reader, self._bell_reader], remaining):
+                    raise Empty
+            finally:
+                self.audio.set_waiting(False)
+            while self._bell_reader.poll():
+                self._bell_reader.recv_bytes()
+
+    def drain_audio(self):
+        """Leer todos los bloques de audio pendientes como (tag, payload)"""
+        while True:
+            try:
+                yield self.audio.get_nowait()
+            except Empty:
+                return
+
+    def close(self):
+        self.audio.close()
+        self._reader.close()
+        self._writer.close()
+        self._bell_reader.close()
+        self._bell_writer.close()
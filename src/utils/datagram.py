@@ -0,0 +1,78 @@
+import struct
+from collections import namedtuple
+
+# Formato de los datagramas del plano de medios UDP.
+#
+# La señalización (sala, usuarios, chat, códec) sigue por Socket.IO; por UDP
+# solo viaja la voz, así un datagrama perdido no frena a los que vienen
+# detrás como pasa con un segmento TCP perdido. El servidor anuncia su
+# puerto y un token por Socket.IO (evento 'media'); el cliente se presenta
+# con HELLO y, cuando recibe el HELLO de vuelta, manda y recibe la voz por
+# UDP. Cada datagrama lleva una sola trama (ver audio/frame.py).
+#
+#   magic       2 bytes MAGIC
+#   kind        uint8   HELLO o VOICE
+#   sender_len  uint8   largo del id del emisor (solo servidor -> cliente)
+#   token       16 bytes token del cliente (solo cliente -> servidor)
+#   seq         uint32  secuencia de datagramas del que envía
+#   relay_time  float64 hora del relay (time.time(); solo servidor -> cliente)
+#   sender      sender_len bytes
+#   payload     trama de voz
+
+MAGIC = b"VC"
+HELLO = 1
+VOICE = 2
+TOKEN_SIZE = 16
+
+_HEADER = struct.Struct("<2sBB16sId")
+HEADER_SIZE = _HEADER.size
+# Mayor datagrama UDP sobre IPv4
+MAX_DATAGRAM = 65507
+
+Datagram = namedtuple("Datagram", "kind token seq relay_time sender payload")
+
+_SEQ_MASK = 0xFFFFFFFF
+# Saltos mayores se toman como un reinicio del que envía, no como pérdidas
+_SEQ_RESYNC = 1024
+
+
+class DatagramError(ValueError):
+    """Datagrama con formato inválido"""
+
+
+def pack_datagram(kind, token=b"", seq=0, relay_time=0.0, sender=b"", payload=b""):
+    if len(sender) > 255:
+        raise DatagramError("Id de emisor demasiado largo")
+    header = _HEADER.pack(MAGIC, kind, len(sender), token, seq & _SEQ_MASK, relay_time)
+    data = b"".join((header, sender, payload))
+    if len(data) > MAX_DATAGRAM:
+        raise DatagramError("Trama demasiado grande para un datagrama")
+    return data
+
+
+def unpack_datagram(data):
+    if len(data) < HEADER_SIZE:
+        raise DatagramError("Datagrama demasiado corto")
+    magic, kind, sender_len, token, seq, relay_time = _HEADER.unpack_from(data)
+    if magic != MAGIC or kind not in (HELLO, VOICE):
+        raise DatagramError("Datagrama desconocido")
+    end = HEADER_SIZE + sender_len
+    if len(data) < end:
+        raise DatagramError("Datagrama truncado")
+    return Datagram(kind, token, seq, relay_time, bytes(data[HEADER_SIZE:end]), data[end:])
+
+
+def seq_advance(last, seq):
+    """Nueva última secuencia y datagramas perdidos entre `last` y `seq`
+
+    Un datagrama atrasado o repetido no cuenta como pérdida ni retrocede la
+    secuencia.
+    """
+    if last is None:
+        return seq, 0
+    ahead = (seq - last) & _SEQ_MASK
+    if ahead == 0 or ahead >= 1 << 31:
+        return last, 0
+    if ahead > _SEQ_RESYNC:
+        return seq, 0
+    return seq, ahead - 1
@@ -0,0 +1,76 @@
+import threading
+from collections import deque
+
+# Trazado de latencia por tramos del camino de voz.
+#
+# Cada tramo guarda sus últimas muestras (en segundos) en una ventana
+# deslizante; `percentiles` resume la ventana actual. Los tramos que cruzan
+# de máquina (p. ej. captura -> relay) usan relojes de pared y dependen de
+# que los relojes estén sincronizados.
+
+CAPTURE_TO_ENQUEUE = "captura→cola"
+ENQUEUE_TO_EMIT = "cola→emit"
+CAPTURE_TO_RELAY = "captura→relay"
+RELAY_TO_ARRIVAL = "relay→llegada"
+ARRIVAL_TO_DEQUEUE = "llegada→recepción"
+DEQUEUE_TO_PLAYOUT = "recepción→salida"
+END_TO_END = "extremo a extremo"
+
+HOPS = [
+    CAPTURE_TO_ENQUEUE,
+    ENQUEUE_TO_EMIT,
+    CAPTURE_TO_RELAY,
+    RELAY_TO_ARRIVAL,
+    ARRIVAL_TO_DEQUEUE,
+    DEQUEUE_TO_PLAYOUT,
+    END_TO_END,
+]
+
+
+class LatencyTracker:
+    """Ventanas deslizantes de latencia por tramo"""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+        # Muestras pendientes de enviar a otro proceso (ver `drain`)
+        self._pending = {}
+
+    def record(self, hop, seconds):
+        """Registrar una muestra; barato, apto para callbacks de audio"""
+        samples = self._samples.get(hop)
+        if samples is None:
+            with self._lock:
+                samples = self._samples.setdefault(hop, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def record_pending(self, hop, seconds):
+        """Registrar una muestra que se va a mandar a otro proceso"""
+        self._pending.setdefault(hop, []).append(seconds)
+
+    def drain(self):
+        """Devolver y vaciar las muestras pendientes"""
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def merge(self, samples):
+        """Incorporar las muestras recibidas de otro proceso"""
+        for hop, values in samples.items():
+            for seconds in values:
+                self.record(hop, seconds)
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """{tramo: {"p50": ms, ...}} con la ventana actual"""
+        # NumPy se importa aquí para no cargarlo al arrancar la ventana
+        import numpy as np
+
+        result = {}
+        for hop in list(self._samples):
+            values = list(self._samples[hop])
+            if not values:
+                continue
+            points = np.percentile(np.asarray(values) * 1000.0, qs)
+            result[hop] = {f"p{q}": float(v) for q, v in zip(qs, points)}
+            result[hop]["n"] = len(values)
+        return result
@@ -0,0 +1,152 @@
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+from queue import Empty
+
+# Ring de memoria compartida para pasar audio entre procesos sin pickle.
+#
+# Un solo productor y un solo consumidor. Cada slot tiene tamaño fijo y un
+# número de secuencia: el productor invalida el slot, escribe y luego publica
+# la secuencia; el consumidor copia el contenido y comprueba que la
+# secuencia no cambió mientras leía (si cambió, el slot fue sobrescrito y se
+# descarta). Si el consumidor se queda atrás, se pierden los más antiguos.
+#
+#   cabecera    uint64 write_seq, uint32 waiting, uint32 (relleno)
+#   slot        uint64 seq, uint32 length, uint16 tag_len, uint16 (relleno),
+#               tag (TAG_SIZE bytes), payload (slot_size bytes)
+
+_WRITE_SEQ = struct.Struct("<Q")
+# Lo escribe solo el consumidor: 1 mientras está por bloquearse esperando
+_WAITING = struct.Struct("<I")
+_WAITING_OFFSET = _WRITE_SEQ.size
+_HEADER_SIZE = 16
+_SLOT_META = struct.Struct("<QIHxx")
+TAG_SIZE = 64
+
+
+class SharedAudioRing:
+    """Ring SPSC de slots fijos en multiprocessing.shared_memory"""
+
+    def __init__(self, slots=64, slot_size=32768, wakeup=True):
+        self.slots = slots
+        self.slot_size = slot_size
+        self._stride = _SLOT_META.size + TAG_SIZE + slot_size
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=_HEADER_SIZE + slots * self._stride
+        )
+        self._owner = True
+        self._buf = self._shm.buf
+        _WRITE_SEQ.pack_into(self._buf, 0, 0)
+        _WAITING.pack_into(self._buf, _WAITING_OFFSET, 0)
+        # Sin `wakeup` el aviso al consumidor corre por cuenta de quien usa el
+        # ring (ver utils/channel.py) y solo se puede leer con get_nowait()
+        self._event = multiprocessing.Event() if wakeup else None
+        self._write_seq = 0
+        self._read_seq = 0
+        self.dropped = 0
+
+    def __getstate__(self):
+        # Al pasar el ring a otro proceso solo viaja el nombre del segmento
+        return {
+            "name": self._shm.name,
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+            "event": self._event,
+        }
+
+    def __setstate__(self, state):
+        self.slots = state["slots"]
+        self.slot_size = state["slot_size"]
+        self._stride = _SLOT_META.size + TAG_SIZE + self.slot_size
+        self._shm = shared_memory.SharedMemory(name=state["name"], track=False)
+        self._owner = False
+        self._buf = self._shm.buf
+        self._event = state["event"]
+        self._write_seq = _WRITE_SEQ.unpack_from(self._buf, 0)[0]
+        self._read_seq = self._write_seq
+        self.dropped = 0
+
+    def _slot_offset(self, seq):
+        return _HEADER_SIZE + ((seq - 1) % self.slots) * self._stride
+
+    @property
+    def pending(self):
+        """¿Hay bloques sin leer? Solo el consumidor."""
+        return _WRITE_SEQ.unpack_from(self._buf, 0)[0] > self._read_seq
+
+    @property
+    def consumer_waiting(self):
+        """¿El consumidor está (o está por quedar) bloqueado esperando?"""
+        return _WAITING.unpack_from(self._buf, _WAITING_OFFSET)[0] != 0
+
+    def set_waiting(self, waiting):
+        """Marcar si el consumidor va a bloquearse. Solo el consumidor."""
+        _WAITING.pack_into(self._buf, _WAITING_OFFSET, 1 if waiting else 0)
+
+    def put(self, payload, tag=b""):
+        """Publicar un bloque (bytes o array contiguo). Solo el productor."""
+        data = memoryview(payload).cast("B")
+        length = len(data)
+        if length > self.slot_size or len(tag) > TAG_SIZE:
+            raise ValueError("Bloque demasiado grande para el slot")
+
+        seq = self._write_seq + 1
+        offset = self._slot_offset(seq)
+        # Invalidar el slot mientras se escribe
+        _SLOT_META.pack_into(self._buf, offset, 0, 0, 0)
+        start = offset + _SLOT_META.size
+        self._buf[start:start + len(tag)] = tag
+        start += TAG_SIZE
+        self._buf[start:start + length] = data
+        _SLOT_META.pack_into(self._buf, offset, seq, length, len(tag))
+
+        self._write_seq = seq
+        _WRITE_SEQ.pack_into(self._buf, 0, seq)
+        if self._event is not None:
+            self._event.set()
+
+    def get_nowait(self):
+        """Leer el siguiente bloque como (tag, payload). Solo el consumidor."""
+        while True:
+            write_seq = _WRITE_SEQ.unpack_from(self._buf, 0)[0]
+            if self._read_seq >= write_seq:
+                raise Empty
+            if write_seq - self._read_seq > self.slots:
+                # El productor dio la vuelta: saltar a lo más antiguo que queda
+                self.dropped += write_seq - self.slots - self._read_seq
+                self._read_seq = write_seq - self.slots
+
+            seq = self._read_seq + 1
+            self._read_seq = seq
+            offset = self._slot_offset(seq)
+            slot_seq, length, tag_len = _SLOT_META.unpack_from(self._buf, offset)
+            if slot_seq != seq:
+                self.dropped += 1
+                continue
+
+            start = offset + _SLOT_META.size
+            tag = bytes(self._buf[start:start + tag_len])
+            start += TAG_SIZE
+            payload = bytes(self._buf[start:start + length])
+            if _SLOT_META.unpack_from(self._buf, offset)[0] != seq:
+                # Sobrescrito mientras se copiaba
+                self.dropped += 1
+                continue
+            return tag, payload
+
+    def get(self, timeout=None):
+        """Esperar (sin sondeo) al siguiente bloque"""
+        while True:
+            try:
+                return self.get_nowait()
+            except Empty:
+                pass
+            if not self._event.wait(timeout):
+                raise Empty
+            self._event.clear()
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
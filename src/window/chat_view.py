@@ -0,0 +1,101 @@
+from collections import deque
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QRect, QSize, Qt
+from PySide6.QtGui import QColor, QPainter
+from PySide6.QtWidgets import QStyledItemDelegate
+
+# Vista de chat virtualizada.
+#
+# Los mensajes viven en un modelo con historial acotado y un delegado los
+# dibuja como burbujas: no hay un widget por mensaje, así que el costo de
+# pintar y de layout depende solo de lo que se ve. Los mensajes que salen
+# del historial se pueden volcar a un archivo.
+
+BUBBLE_COLOR = QColor("#000000")
+TEXT_COLOR = QColor("#ffffff")
+BUBBLE_PADDING = (12, 8)  # Horizontal, vertical
+BUBBLE_MARGIN = 4  # Separación entre burbujas
+BUBBLE_RADIUS = 8
+MIN_BUBBLE_HEIGHT = 36
+
+
+class ChatModel(QAbstractListModel):
+    """Mensajes de chat con un máximo en memoria"""
+
+    def __init__(self, max_messages=500, spill_path=None, parent=None):
+        super().__init__(parent)
+        self.max_messages = max_messages
+        self._messages = deque()
+        # Archivo opcional donde se agregan los mensajes que se descartan
+        self._spill = open(spill_path, "a", encoding="utf-8", buffering=65536) if spill_path else None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._messages)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and 0 <= index.row() < len(self._messages):
+            return self._messages[index.row()]
+        return None
+
+    def append_messages(self, messages):
+        """Agregar varios mensajes con una sola inserción"""
+        if not messages:
+            return
+        messages = list(messages)
+        # Lo que ni siquiera entra en el historial va directo al archivo
+        skipped = messages[:-self.max_messages]
+        messages = messages[-self.max_messages:]
+        overflow = max(0, len(self._messages) + len(messages) - self.max_messages)
+        evicted = []
+        if overflow:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            evicted = [self._messages.popleft() for _ in range(overflow)]
+            self.endRemoveRows()
+        if self._spill is not None and (evicted or skipped):
+            self._spill.write("".join(f"{msg}\n" for msg in evicted + skipped))
+
+        first = len(self._messages)
+        self.beginInsertRows(QModelIndex(), first, first + len(messages) - 1)
+        self._messages.extend(messages)
+        self.endInsertRows()
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
+class ChatDelegate(QStyledItemDelegate):
+    """Dibuja cada mensaje como una burbuja con el texto ajustado al ancho"""
+
+    _FLAGS = Qt.TextFlag.TextWordWrap | Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
+
+    def _text_rect(self, option, text, width):
+        pad_x, pad_y = BUBBLE_PADDING
+        bounds = QRect(0, 0, max(1, width - 2 * pad_x), 100000)
+        return option.fontMetrics.boundingRect(bounds, self._FLAGS, text)
+
+    def _width(self, option):
+        view = self.parent()
+        if view is not None:
+            return view.viewport().width()
+        return option.rect.width()
+
+    def sizeHint(self, option, index):
+        text = index.data() or ""
+        width = self._width(option)
+        height = self._text_rect(option, text, width).height() + 2 * BUBBLE_PADDING[1]
+        return QSize(width, max(MIN_BUBBLE_HEIGHT, height) + BUBBLE_MARGIN)
+
+    def paint(self, painter, option, index):
+        text = index.data() or ""
+        pad_x, pad_y = BUBBLE_PADDING
+        bubble = option.rect.adjusted(0, 0, 0, -BUBBLE_MARGIN)
+
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(BUBBLE_COLOR)
+        painter.drawRoundedRect(bubble, BUBBLE_RADIUS, BUBBLE_RADIUS)
+        painter.setPen(TEXT_COLOR)
+        painter.drawText(bubble.adjusted(pad_x, pad_y, -pad_x, -pad_y), self._FLAGS, text)
+        painter.restore()
@@ -0,0 +1,72 @@
+import os
+import json
+import threading
+
+# Listado de dispositivos de audio en segundo plano.
+#
+# Consultar PortAudio (e importar sounddevice) tarda; se arranca al inicio
+# en un hilo mientras se muestran los primeros diálogos. La última selección
+# del usuario se guarda en disco para ofrecerla como opción por defecto.
+
+SELECTION_PATH = os.path.join(os.path.expanduser("~"), ".voicechat", "last_selection.json")
+
+
+def list_devices():
+    """{"input": {nombre: índice}, "output": {nombre: índice}}"""
+    import sounddevice as sd
+
+    print("\nDispositivos disponibles:")
+    dispositivos = sd.query_devices()
+    list_dispositivos = {"input": {}, "output": {}}
+
+    for i, d in enumerate(dispositivos):
+        name = d.get('name', 'Unknown')
+        if d.get('max_input_channels', 0) > 0:
+            list_dispositivos["input"][name] = i
+        if d.get('max_output_channels', 0) > 0:
+            list_dispositivos["output"][name] = i
+
+    return list_dispositivos
+
+
+class DeviceProbe:
+    """Lista los dispositivos en un hilo; `result()` espera a que termine"""
+
+    def __init__(self):
+        self._devices = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._devices = list_devices()
+        except Exception as e:
+            self._error = e
+
+    def result(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._devices
+
+
+def load_last_selection():
+    """Última selección guardada ({} si no hay o no se puede leer)"""
+    try:
+        with open(SELECTION_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_last_selection(selection):
+    try:
+        os.makedirs(os.path.dirname(SELECTION_PATH), exist_ok=True)
+        with open(SELECTION_PATH, "w", encoding="utf-8") as f:
+            json.dump(selection, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"No se pudo guardar la selección: {e}")
@@ -1,27 +1,63 @@
 import sys
 from PySide6.QtWidgets import QApplication, QInputDialog, QLabel, QMessageBox, QSizePolicy, QVBoxLayout, QWidget
-from PySide6.QtCore import Qt, Signal
-import sounddevice as sd
-from audio.audio import MicrophoneListener
+from PySide6.QtCore import Qt, QTimer, Signal
+from PySide6.QtGui import QKeySequence, QShortcut
 from window.window import CreateWindow
-from client.client import Client
+from window.chat_view import ChatDelegate, ChatModel
+from window.device_probe import DeviceProbe, load_last_selection, save_last_selection
 import multiprocessing
 import platform
+from audio.rates import DEFAULT_WIRE_SAMPLERATE, WIRE_SAMPLERATES
+from utils.latency import HOPS
 from utils.thread_utils import create_high_priority_thread, set_high_priority
 
 UI_FILE = "./src/ui/main.ui"
+try:
+    # Clase generada en el build con pyside6-uic (ver compile.ps1); si no
+    # está, main.ui se interpreta al arrancar con QUiLoader
+    from ui.ui_main import Ui_Dialog as MainUi
+except ImportError:
+    MainUi = None
+# Mensajes de chat en memoria; los más viejos se descartan (o se vuelcan a
+# CHAT_SPILL_PATH si se configura)
+CHAT_HISTORY = 500
+CHAT_SPILL_PATH = None
 
 class MyMainWindow(CreateWindow):
     chat_message_signal = Signal(str)
-    new_user_signal = Signal(str)
+    new_user_signal = Signal(str, str)
     remove_user_signal = Signal(str)
+    roster_signal = Signal(list)
 
-    def __init__(self):
-        super().__init__(UI_FILE)
+    def __init__(self, device_probe=None):
+        super().__init__(UI_FILE, ui_class=MainUi)
         self.listener_thread = None
         self.microphone_listener = None
         self.setup_ui()
-        dispositivos = self.listar_dispositivos()
+        # Los dispositivos se listan en segundo plano mientras se piden el
+        # nombre y la sala
+        device_probe = device_probe or DeviceProbe().start()
+        last = load_last_selection()
+
+        self.name, ok = QInputDialog.getText(None, "Name", "Write your name:", text=last.get("name", ""))
+        if not ok:
+            QMessageBox.information(
+                None,
+                "Sorry",
+                "I need your name"
+            )
+            sys.exit()
+            
+        self.code, ok = QInputDialog.getText(None, "Room", "Room code:", text=last.get("room", ""))
+        if not ok:
+            QMessageBox.information(
+                None,
+                "Sorry",
+                "I need room code"
+            )
+            sys.exit()
+
+        dispositivos = device_probe.result()
         dispositivos_entrada = [(index, name) for name, index in dispositivos["input"].items()]
         print(dispositivos_entrada)
 
@@ -30,7 +66,10 @@ class MyMainWindow(CreateWindow):
             sys.exit()
 
         mic_names = [d[1] for d in dispositivos_entrada]
-        mic_choice, ok = QInputDialog.getItem(None, "Seleccionar micrófono", "Elige el micrófono de entrada:", mic_names, 0, False)
+        mic_choice, ok = QInputDialog.getItem(
+            None, "Seleccionar micrófono", "Elige el micrófono de entrada:", mic_names,
+            _last_index(mic_names, last.get("input")), False,
+        )
         if not ok:
             QMessageBox.information(None, "Cancelado", "Se requiere seleccionar un micrófono.")
             sys.exit()
@@ -42,52 +81,57 @@ class MyMainWindow(CreateWindow):
             QMessageBox.critical(None, "Error", "No se encontraron dispositivos de salida de audio.")
             sys.exit()
         out_names = [d[1] for d in dispositivos_salida]
-        out_choice, ok = QInputDialog.getItem(None, "Seleccionar salida de audio", "Elige el dispositivo de salida:", out_names, 0, False)
+        out_choice, ok = QInputDialog.getItem(
+            None, "Seleccionar salida de audio", "Elige el dispositivo de salida:", out_names,
+            _last_index(out_names, last.get("output")), False,
+        )
         if not ok:
             QMessageBox.information(None, "Cancelado", "Se requiere seleccionar una salida de audio.")
             sys.exit()
         self.output_device = dispositivos_salida[out_names.index(out_choice)][0]
 
-        self.name, ok = QInputDialog.getText(None, "Name", "Write your name:")
-        if not ok:
-            QMessageBox.information(
-                None,
-                "Sorry",
-                "I need your name"
-            )
-            sys.exit()
-            
-        self.code, ok = QInputDialog.getText(None, "Room", "Room code:")
-        if not ok:
-            QMessageBox.information(
-                None,
-                "Sorry",
-                "I need room code"
-            )
-            sys.exit()
-
+        # Frecuencia de la voz en la red; el dispositivo puede usar otra
+        rate_names = [f"{rate // 1000} kHz" for rate in WIRE_SAMPLERATES]
+        rate_choice, ok = QInputDialog.getItem(
+            None, "Calidad de voz", "Frecuencia de muestreo para enviar:", rate_names,
+            _last_index(rate_names, last.get("rate"), WIRE_SAMPLERATES.index(DEFAULT_WIRE_SAMPLERATE)), False,
+        )
+        self.wire_samplerate = WIRE_SAMPLERATES[rate_names.index(rate_choice)] if ok else DEFAULT_WIRE_SAMPLERATE
+
+        save_last_selection({
+            "name": self.name,
+            "room": self.code,
+            "input": mic_choice,
+            "output": out_choice,
+            "rate": rate_choice,
+        })
+
+        # socketio y NumPy se cargan recién aquí, con los diálogos ya resueltos
+        from client.client import Client
         self.client = Client(
             url="http://127.0.0.1:3500",
             callback_play_sound=self.process_audio_data,
             callback_chat_message=self.receive_chat_message,
             callback_users_online=self.receive_users_online,
             callback_remove_user=self.receive_remove_user,
+            callback_roster=self.receive_roster,
             name=self.name,
             room_code=self.code,
         )
 
         self.ui_widget.label_room.setText(self.code)
 
-        # --- Chat scrollable area setup ---
-        self.chat_scroll_area = self.ui_widget.chat
-
-        self.chat_scroll_area.setWidgetResizable(True)
-        self.chat_container = QWidget()
-        self.chat_layout = QVBoxLayout(self.chat_container)
-        self.chat_layout.setSpacing(8)
-        self.chat_layout.addStretch(1)  # Para empujar mensajes hacia arriba
-        self.chat_container.setLayout(self.chat_layout)
-        self.chat_scroll_area.setWidget(self.chat_container)
+        # --- Chat: lista virtualizada con historial acotado ---
+        self.chat_view = self.ui_widget.chat
+        self.chat_model = ChatModel(max_messages=CHAT_HISTORY, spill_path=CHAT_SPILL_PATH, parent=self)
+        self.chat_view.setModel(self.chat_model)
+        self.chat_view.setItemDelegate(ChatDelegate(self.chat_view))
+        # Los mensajes que llegan en el mismo tick se insertan juntos
+        self._pending_chat = []
+        self._chat_flush = QTimer(self)
+        self._chat_flush.setSingleShot(True)
+        self._chat_flush.setInterval(0)
+        self._chat_flush.timeout.connect(self._flush_chat_messages)
 
         self.name_scroll_area = self.ui_widget.scroll_area_connect
         self.name_scroll_area.setWidgetResizable(True)
@@ -97,7 +141,7 @@ class MyMainWindow(CreateWindow):
         self.name_layout.addStretch(1)  # Para empujar mensajes hacia arriba
         self.name_container.setLayout(self.name_layout)
         self.name_scroll_area.setWidget(self.name_container)
-        # --- End chat scrollable area setup ---
+        # --- End chat setup ---
 
         # Configurar la ventana para mantener el procesamiento en segundo plano
         self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose, False)
@@ -112,31 +156,68 @@ class MyMainWindow(CreateWindow):
         self.chat_message_signal.connect(self._add_chat_message)
         self.new_user_signal.connect(self._add_new_user)
         self.remove_user_signal.connect(self._remove_user)
+        self.roster_signal.connect(self._set_roster)
+
+        self.setup_latency_overlay()
+
+    def setup_latency_overlay(self):
+        """Panel con los percentiles de latencia por tramo (F3 para mostrarlo)"""
+        self.latency_label = QLabel(self)
+        self.latency_label.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents, True)
+        self.latency_label.setStyleSheet("""
+            color: #00ff00;
+            background: rgba(0, 0, 0, 180);
+            font-family: monospace;
+            padding: 6px;
+        """)
+        self.latency_label.move(8, 8)
+        self.latency_label.hide()
+
+        self.latency_timer = QTimer(self)
+        self.latency_timer.setInterval(1000)
+        self.latency_timer.timeout.connect(self._update_latency_overlay)
 
-    def listar_dispositivos(self):
-        print("\nDispositivos disponibles:")
-        dispositivos = sd.query_devices()
-        list_dispositivos = {"input": {}, "output": {}}
-
-        for i, d in enumerate(dispositivos):
-            tipo = "input/output"
-            if d.get('max_input_channels', 0) > 0 and d.get('max_output_channels', 0) > 0:
-                tipo = "input/output"
-            elif d.get('max_input_channels', 0) > 0:
-                tipo = "input"
-            elif d.get('max_output_channels', 0) > 0:
-                tipo = "output"
-            name = d.get('name', 'Unknown')
-            if name == 'Unknown':
-                pass
-
-            if tipo == "input/output":
-                list_dispositivos["input"][name] = i
-                list_dispositivos["output"][name] = i
-            else:
-                list_dispositivos[tipo][name] = i
-
-        return list_dispositivos
+        QShortcut(QKeySequence("F3"), self, activated=self.toggle_latency_overlay)
+
+    def toggle_latency_overlay(self):
+        if self.latency_label.isVisible():
+            self.latency_timer.stop()
+            self.latency_label.hide()
+            return
+        self._update_latency_overlay()
+        self.latency_label.show()
+        self.latency_label.raise_()
+        self.latency_timer.start()
+
+    def _update_latency_overlay(self):
+        stats = self.client.latency_stats()
+        lines = ["tramo                  p50     p95     p99"]
+        for hop in HOPS:
+            if hop in stats:
+                s = stats[hop]
+                lines.append(f"{hop:<20} {s['p50']:6.1f}  {s['p95']:6.1f}  {s['p99']:6.1f} ms")
+        if len(lines) == 1:
+            lines.append("sin datos todavía")
+        lines.append(f"voz por {self.client.voice_transport}")
+        if self.client.stale_dropped:
+            lines.append(f"bloques descartados por viejos: {self.client.stale_dropped}")
+        if self.microphone_listener:
+            listener = self.microphone_listener
+            if listener.adaptive is not None:
+                lines.append(
+                    f"trama {listener.frame_ms} ms, retardo {listener.adaptive.playout_delay_ms:.0f} ms"
+                )
+            jitter = listener.jitter_stats()
+            if jitter:
+                lines.append("")
+                lines.append("hablante     jitter  ocultos  tardíos  vacíos")
+            for speaker, s in jitter.items():
+                lines.append(
+                    f"{str(speaker)[:10]:<10} {s['jitter_ms']:6.1f} ms  "
+                    f"{s['concealed']:7d}  {s['late']:7d}  {s['underruns']:6d}"
+                )
+        self.latency_label.setText("\n".join(lines))
+        self.latency_label.adjustSize()
 
     def setup_ui(self):
         if hasattr(self.ui_widget, 'btn_mute'):
@@ -154,36 +235,35 @@ class MyMainWindow(CreateWindow):
     def receive_chat_message(self, msg):
         self.chat_message_signal.emit(msg)
 
-    def receive_users_online(self, name):
-        self.new_user_signal.emit(name)
+    def receive_users_online(self, user_id, name):
+        self.new_user_signal.emit(user_id, name)
 
-    def receive_remove_user(self, name):
-        self.remove_user_signal.emit(name)
+    def receive_remove_user(self, user_id):
+        self.remove_user_signal.emit(user_id)
 
-    def _add_chat_message(self, msg):
-        label = QLabel(msg)
-        label.setWordWrap(True)
-        label.setMinimumHeight(36)  # Altura mínima para simular burbuja de chat
-        label.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
-        label.setStyleSheet("""
-            background: #000000;
-            border-radius: 8px;
-            padding: 8px 12px;
-            margin-bottom: 4px;
-        """)
-        self.chat_layout.insertWidget(self.chat_layout.count() - 1, label)
+    def receive_roster(self, users):
+        self.roster_signal.emit(users)
 
-        # Scroll automático al final
-        if self.chat_scroll_area is not None:
-            self.chat_scroll_area.verticalScrollBar().setValue(
-                self.chat_scroll_area.verticalScrollBar().maximum()
-            )
+    def _add_chat_message(self, msg):
+        self._pending_chat.append(msg)
+        if not self._chat_flush.isActive():
+            self._chat_flush.start()
+
+    def _flush_chat_messages(self):
+        pending, self._pending_chat = self._pending_chat, []
+        scrollbar = self.chat_view.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+        self.chat_model.append_messages(pending)
+
+        # Scroll automático al final, salvo si el usuario está leyendo arriba
+        if at_bottom:
+            self.chat_view.scrollToBottom()
     
-    def _add_new_user(self, name):
+    def _add_new_user(self, user_id, name):
         if not hasattr(self, 'user_labels'):
             self.user_labels = {}
         
-        if name in self.user_labels:
+        if user_id in self.user_labels:
             return
         
         # Crear nuevo label solo si no existe
@@ -200,17 +280,26 @@ class MyMainWindow(CreateWindow):
         """)
         
         # Guardar referencia
-        self.user_labels[name] = label
+        self.user_labels[user_id] = label
         
         # Añadir al layout
         self.name_layout.insertWidget(self.name_layout.count() - 1, label)
 
-    def _remove_user(self, name):
-        if hasattr(self, 'user_labels') and name in self.user_labels:
-            label = self.user_labels[name]
+    def _remove_user(self, user_id):
+        if hasattr(self, 'user_labels') and user_id in self.user_labels:
+            label = self.user_labels[user_id]
             self.name_layout.removeWidget(label)
             label.deleteLater()
-            del self.user_labels[name]
+            del self.user_labels[user_id]
+
+    def _set_roster(self, users):
+        """Reemplazar la lista de conectados por la recibida al entrar"""
+        ids = {user["id"] for user in users}
+        for user_id in list(getattr(self, 'user_labels', {})):
+            if user_id not in ids:
+                self._remove_user(user_id)
+        for user in users:
+            self._add_new_user(user["id"], user["name"])
 
     def set_monitor_volume(self, value):
         """Cambiar volumen de monitoreo (0-100)"""
@@ -231,16 +320,19 @@ class MyMainWindow(CreateWindow):
         input_device = self.input_device
         output_device = self.output_device
         
+        from audio.audio import MicrophoneListener
+
         # Crear MicrophoneListener con callback de error
         self.microphone_listener = MicrophoneListener(
-            samplerate=44100,
+            wire_samplerate=self.wire_samplerate,
             channels=1,
-            blocksize_ms=40,  # Aumentar para reducir overflow/underflow
+            blocksize_ms=20,  # Trama inicial; después la ajusta audio/adaptive.py
             input_device=input_device,
             output_device=output_device,
             monitor_gain=0.7,  # Volumen inicial
             send_package=self.client.send_package,
-            on_error=self._handle_audio_error
+            on_error=self._handle_audio_error,
+            latency_tracker=self.client.latency,
         )
         
         # Usar threading.Thread con alta prioridad para el audio
@@ -257,9 +349,9 @@ class MyMainWindow(CreateWindow):
             if hasattr(self.ui_widget, 'btn_mute'):
                 self.ui_widget.btn_mute.setText("Iniciar micrófono")
 
-    def process_audio_data(self, data):
+    def process_audio_data(self, data, speaker=None, trace=None, samplerate=None):
         if self.microphone_listener and hasattr(self.microphone_listener, 'audio_queue_put'):
-            self.microphone_listener.audio_queue_put(data)
+            self.microphone_listener.audio_queue_put(data, speaker, trace, samplerate)
 
     def changeEvent(self, event):
         """Manejar cambios de estado de la ventana (minimizar, restaurar, etc.)"""
@@ -273,10 +365,17 @@ class MyMainWindow(CreateWindow):
         self.stop_listening()
         if self.client:
             self.client.stop()
+        self.chat_model.close()
         event.accept()
 
+def _last_index(names, last, default=0):
+    """Índice de la opción elegida la vez anterior, si sigue disponible"""
+    return names.index(last) if last in names else default
+
 def start_home():
     multiprocessing.freeze_support()
+    # Listar dispositivos mientras arranca Qt
+    device_probe = DeviceProbe().start()
     app = QApplication(sys.argv)
     
     # Configurar la aplicación para mantener el procesamiento en segundo plano
@@ -287,6 +386,6 @@ def start_home():
         # En Windows, configurar para mantener hilos activos
         app.setAttribute(Qt.ApplicationAttribute.AA_EnableHighDpiScaling, True)
     
-    window = MyMainWindow()
+    window = MyMainWindow(device_probe)
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
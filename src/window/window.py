@@ -1,18 +1,33 @@
 import sys
-from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout
-from PySide6.QtUiTools import QUiLoader
-from PySide6.QtCore import QFile, QIODevice
+from PySide6.QtWidgets import QApplication, QDialog, QWidget, QVBoxLayout
 
 class CreateWindow(QWidget):
 	UI_FILE: str = None
 	ui_widget = None
 
-	def __init__(self, path_ui):
+	def __init__(self, path_ui, ui_class=None):
 		super().__init__()
 		self.UI_FILE = path_ui
-		self.load_ui()
+		if ui_class is not None:
+			self.setup_generated_ui(ui_class)
+		else:
+			self.load_ui()
+
+	def setup_generated_ui(self, ui_class):
+		"""Construir la interfaz con la clase generada por pyside6-uic (sin leer el .ui)"""
+		self.ui_widget = QDialog()
+		ui = ui_class()
+		ui.setupUi(self.ui_widget)
+		# Igual que con QUiLoader: cada widget queda como atributo de ui_widget
+		for name, child in vars(ui).items():
+			setattr(self.ui_widget, name, child)
+		self.embed_ui()
 
 	def load_ui(self):
+		# Importado aquí: QtUiTools solo hace falta si no hay clase generada
+		from PySide6.QtUiTools import QUiLoader
+		from PySide6.QtCore import QFile, QIODevice
+
 		loader = QUiLoader()
 		ui_file = QFile(self.UI_FILE)
 		if not ui_file.open(QIODevice.ReadOnly):
@@ -26,6 +41,9 @@ class CreateWindow(QWidget):
 			print("Error al cargar la interfaz de usuario.")
 			sys.exit(-1)
 
+		self.embed_ui()
+
+	def embed_ui(self):
 		# Create a layout for MyMainWindow
 		main_layout = QVBoxLayout(self) # Set 'self' as the parent for the layout
 		main_layout.addWidget(self.ui_widget) # Add the loaded UI widget to this layout
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos del cliente y del servidor se importan desde src/, como en la app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,58 @@
+import sys
+import types
+import numpy as np
+
+# _capture no usa el dispositivo: las pruebas no necesitan PortAudio
+sys.modules.setdefault("sounddevice", types.ModuleType("sounddevice"))
+
+from audio.audio import MicrophoneListener  # noqa: E402
+
+SAMPLERATE = 48000
+
+
+def make_listener():
+    sent, errors = [], []
+    listener = MicrophoneListener(
+        samplerate=SAMPLERATE, vad=False, wire_samplerate=SAMPLERATE,
+        send_package=sent.append, on_error=errors.append,
+    )
+    return listener, sent, errors
+
+
+def capture(listener, ms, block_ms=10):
+    block = np.zeros((SAMPLERATE * block_ms // 1000, 1), dtype=np.float32)
+    for _ in range(ms // block_ms):
+        listener._capture(block, len(block))
+
+
+def test_frame_shrinks_mid_frame():
+    listener, sent, errors = make_listener()
+    listener.frame_ms = 60
+    capture(listener, 40)
+    # El controlador achica la trama con 40 ms ya acumulados
+    listener.frame_ms = 20
+    capture(listener, 60)
+
+    assert errors == []
+    # La trama en curso se termina con el tamaño anterior; después, 20 ms
+    assert [len(package["data"]) for package in sent] == [2880, 960, 960]
+
+
+def test_frame_grows_mid_frame():
+    listener, sent, errors = make_listener()
+    listener.frame_ms = 20
+    capture(listener, 10)
+    listener.frame_ms = 60
+    capture(listener, 70)
+
+    assert errors == []
+    assert [len(package["data"]) for package in sent] == [960, 2880]
+
+
+def test_new_speaker_is_kept_for_playback():
+    listener, _, _ = make_listener()
+    block = np.full((960, 1), 0.1, dtype=np.float32)
+    listener.audio_queue_put(block, "otro")
+    listener.audio_queue_put(block, "otro")
+
+    assert [buffer.available for buffer in listener._mix_buffers] == [1920]
@@ -0,0 +1,47 @@
+from client.client import BACKEND_ASYNCIO, Client
+from relay.store import RoomStore
+
+
+def make_client(shown):
+    return Client(callback_chat_message=shown.append, backend=BACKEND_ASYNCIO, udp=False)
+
+
+def send_chat(store, client, code, msg):
+    # Lo que hace el handler chat_message del servidor con quien está conectado
+    msg_id = store.add_chat(code, msg)
+    if client is not None:
+        client._chat_message(msg, msg_id)
+
+
+def test_reconnect_does_not_repeat_chat():
+    store = RoomStore()
+    store.join("sala", "otro", "u2", "Otro", ["pcm16"])
+    send_chat(store, None, "sala", "Otro: antes de entrar")
+
+    shown = []
+    client = make_client(shown)
+    store.join("sala", "sid1", "u1", "Yo", ["pcm16"])
+    client._chat_backlog(store.chat_backlog("sala"))
+    send_chat(store, client, "sala", "Otro: hola")
+
+    # Se corta la conexión; mientras tanto sigue el chat
+    store.leave("sid1")
+    send_chat(store, None, "sala", "Otro: ¿seguís ahí?")
+
+    # Al reconectar el servidor vuelve a mandar todo el historial
+    store.join("sala", "sid2", "u1", "Yo", ["pcm16"])
+    client._chat_backlog(store.chat_backlog("sala"))
+    send_chat(store, client, "sala", "Otro: volviste")
+
+    assert shown == [
+        "Otro: antes de entrar",
+        "Otro: hola",
+        "Otro: ¿seguís ahí?",
+        "Otro: volviste",
+    ]
+
+
+def test_chat_ids_survive_a_new_store():
+    # Tras reiniciar el servidor los ids no chocan con los ya mostrados
+    first, second = RoomStore(), RoomStore()
+    assert first.add_chat("sala", "a") != second.add_chat("sala", "a")
@@ -0,0 +1,38 @@
+import numpy as np
+from audio.vad import VoiceActivityDetector
+
+SAMPLERATE = 48000
+BLOCK = 960  # 20 ms
+
+
+def tone(frequency, amplitude, start, length=BLOCK):
+    t = (np.arange(length) + start) / SAMPLERATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)[:, np.newaxis]
+
+
+def hum(start):
+    # Zumbido de la red con su armónico: energía constante, pocos cruces por cero
+    return tone(50, 0.05, start) + tone(100, 0.02, start)
+
+
+def test_steady_hum_is_suppressed():
+    vad = VoiceActivityDetector(SAMPLERATE)
+    decisions = [vad.is_speech(hum(i * BLOCK)) for i in range(250)]  # 5 s
+    # Pasada la ventana del piso de ruido, el zumbido ya no cuenta como voz
+    assert not any(decisions[200:])
+
+
+def test_voice_over_hum_is_detected():
+    vad = VoiceActivityDetector(SAMPLERATE)
+    for i in range(250):
+        vad.is_speech(hum(i * BLOCK))
+    start = 250 * BLOCK
+    assert vad.is_speech(hum(start) + tone(300, 0.4, start))
+
+
+def test_quiet_room_floor_stays_low():
+    vad = VoiceActivityDetector(SAMPLERATE)
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        vad.is_speech((rng.standard_normal((BLOCK, 1)) * 1e-4).astype(np.float32))
+    assert vad.is_speech(tone(200, 0.1, 0))